@@ -36,6 +36,10 @@ DATA 2410: Mininet script to produce a network like the following:
 '''
 
 
+import os
+import sys
+import time
+
 from mininet.topo import Topo
 from mininet.net import Mininet
 from mininet.node import Node
@@ -116,55 +120,76 @@ class PortfolioNetwork2410( Topo ):
 
 
 
-topo = PortfolioNetwork2410()
-net = Mininet( topo=topo, link=TCLink )
-net.start()
-
-#ip route add ipA via ipB dev INTERFACE
+# Static routes of the routers, as lines of ip -batch
+#route add ipA via ipB dev INTERFACE
 #every packet going to ipA must first go to ipB using INTERFACE
-net["r2"].cmd("ip route add 10.0.0.0/24 via 10.0.1.1 dev r2-eth0")
-net["r2"].cmd("ip route add 10.0.4.0/24 via 10.0.3.2 dev r2-eth2")
-net["r2"].cmd("ip route add 10.0.5.0/24 via 10.0.3.2 dev r2-eth2")
-net["r2"].cmd("ip route add 10.0.6.0/24 via 10.0.3.2 dev r2-eth2")
-net["r2"].cmd("ip route add 10.0.7.0/24 via 10.0.3.2 dev r2-eth2")
-
-net["r3"].cmd("ip route add 10.0.0.0/24 via 10.0.3.1 dev r3-eth0")
-net["r3"].cmd("ip route add 10.0.1.0/24 via 10.0.3.1 dev r3-eth0")
-net["r3"].cmd("ip route add 10.0.2.0/24 via 10.0.3.1 dev r3-eth0")
-net["r3"].cmd("ip route add 10.0.7.0/24 via 10.0.6.2 dev r3-eth3")
-
-
-net["r1"].cmd("ethtool -K r1-eth1 tso off")
-net["r1"].cmd("ethtool -K r1-eth1 gso off")
-net["r1"].cmd("ethtool -K r1-eth1 lro off")
-net["r1"].cmd("ethtool -K r1-eth1 gro off")
-net["r1"].cmd("ethtool -K r1-eth1 ufo off")
-
-
-net["r2"].cmd("ethtool -K r2-eth2 tso off")
-net["r2"].cmd("ethtool -K r2-eth2 gso off")
-net["r2"].cmd("ethtool -K r2-eth2 lro off")
-net["r2"].cmd("ethtool -K r2-eth2 gro off")
-net["r2"].cmd("ethtool -K r2-eth2 ufo off")
-
-
-net["r3"].cmd("ethtool -K r3-eth3 tso off")
-net["r3"].cmd("ethtool -K r3-eth3 gso off")
-net["r3"].cmd("ethtool -K r3-eth3 lro off")
-net["r3"].cmd("ethtool -K r3-eth3 gro off")
-net["r3"].cmd("ethtool -K r3-eth3 ufo off")
-
-for i in range (1,10,1):
-    node = "h" + str(i)
-    iface = node + "-eth0" 
-    net[node].cmd("ethtool -K " + iface + " tso off")
-    net[node].cmd("ethtool -K " + iface + " gso off")
-    net[node].cmd("ethtool -K " + iface + " lro off")
-    net[node].cmd("ethtool -K " + iface + " gro off")
-    net[node].cmd("ethtool -K " + iface + " ufo off")
-
-
-
-net.pingAll()
-CLI( net )
-net.stop()
\ No newline at end of file
+ROUTES = {
+    "r2": [ "route add 10.0.0.0/24 via 10.0.1.1 dev r2-eth0",
+            "route add 10.0.4.0/24 via 10.0.3.2 dev r2-eth2",
+            "route add 10.0.5.0/24 via 10.0.3.2 dev r2-eth2",
+            "route add 10.0.6.0/24 via 10.0.3.2 dev r2-eth2",
+            "route add 10.0.7.0/24 via 10.0.3.2 dev r2-eth2" ],
+    "r3": [ "route add 10.0.0.0/24 via 10.0.3.1 dev r3-eth0",
+            "route add 10.0.1.0/24 via 10.0.3.1 dev r3-eth0",
+            "route add 10.0.2.0/24 via 10.0.3.1 dev r3-eth0",
+            "route add 10.0.7.0/24 via 10.0.6.2 dev r3-eth3" ],
+}
+
+# Offloads turned off, so the links see packets of the MTU and not segments of 64 KB
+OFFLOADS = ( "tso", "gso", "lro", "gro", "ufo" )
+
+# Interfaces the offloads are turned off on: the routers' shaped links and every host's interface
+OFFLOAD_INTERFACES = { "r1": [ "r1-eth1" ], "r2": [ "r2-eth2" ], "r3": [ "r3-eth3" ] }
+OFFLOAD_INTERFACES.update( { "h" + str(i): [ "h" + str(i) + "-eth0" ] for i in range (1,10,1) } )
+
+
+# Define a function to build the configuration of every node as one line of shell: one ethtool per interface
+# for all its offloads, and all its routes in one ip -batch
+def plan():
+    commands = {}
+    for node, interfaces in OFFLOAD_INTERFACES.items():
+        for iface in interfaces:
+            commands.setdefault( node, [] ).append( "ethtool -K " + iface + " " + " ".join( offload + " off" for offload in OFFLOADS ) )
+    for node, routes in ROUTES.items():
+        lines = " ".join( "'" + route + "'" for route in routes )
+        commands.setdefault( node, [] ).append( "printf '%s\\n' " + lines + " | ip -batch -" )
+    return { node: " ; ".join( lines ) for node, lines in commands.items() }
+
+# Define a function to apply the plan once the network has started. Every node's line is sent to its shell
+# first and the outputs are collected after, so the nodes configure themselves at the same time
+def configure( net ):
+    startTime = time.time()
+    commands = plan()
+    for node, command in commands.items():
+        net[ node ].sendCmd( command )
+    for node in commands:
+        net[ node ].waitOutput()
+    info( '*** Configured %d nodes in %.3f s\n' % ( len( commands ), time.time() - startTime ) )
+
+# Define a function to write the plan as one shell script per node, to read or run without Mininet
+def write_plan( directory ):
+    os.makedirs( directory, exist_ok=True )
+    for node, command in plan().items():
+        with open( os.path.join( directory, node + ".sh" ), "w" ) as script:
+            script.write( "#!/bin/sh\n# Configuration of " + node + " in PortfolioNetwork2410\n" + command.replace( " ; ", "\n" ) + "\n" )
+
+
+# Build, start and configure the network. Importing this file only defines the topology, so scripts such as
+# simpleperf/scenario.py can start the network themselves
+def start_network():
+    topo = PortfolioNetwork2410()
+    net = Mininet( topo=topo, link=TCLink )
+    net.start()
+    configure( net )
+    return net
+
+
+if __name__ == '__main__':
+    # With --plan DIRECTORY the configuration is written as scripts and no network is started
+    if len( sys.argv ) == 3 and sys.argv[1] == '--plan':
+        write_plan( sys.argv[2] )
+        sys.exit()
+    net = start_network()
+    net.pingAll()
+    CLI( net )
+    net.stop()
@@ -0,0 +1,401 @@
+import argparse
+import base64
+import json
+import math
+import os
+import re
+import sys
+from array import array
+
+# NumPy makes the statistics vectorized; without it the same columns are processed with the standard library
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Cache of parsed files, written to the root of the measurements tree and keyed by each file's mtime and size.
+# It is JSON holding the bytes of every column, so a cache planted in the tree can at worst give wrong numbers
+CACHE_NAME = '.simpleperf-cache'
+CACHE_VERSION = 2
+
+# Columns of each table in the store, with their array typecodes. 'case', 'run', 'file' and 'flow' are codes
+# into the store's lists of names, so every column is a flat array of numbers
+TABLES = {
+    'throughput': {'case': 'i', 'run': 'i', 'file': 'i', 'flow': 'i', 'start': 'd', 'end': 'd', 'bytes': 'd', 'mbps': 'd',
+                   'final': 'b', 'jitter': 'd', 'lost': 'q', 'total': 'q'},
+    'rtt': {'case': 'i', 'run': 'i', 'file': 'i', 'seq': 'q', 'rtt': 'd'},
+    'ping': {'case': 'i', 'run': 'i', 'file': 'i', 'sent': 'q', 'received': 'q'},
+}
+# Columns filled in from the file's place in the tree when it is added to the store, not by the parser
+LOCATION_COLUMNS = ('case', 'run', 'file')
+
+# Percentiles reported for throughput and round-trip times
+PERCENTILES = (50, 90, 99)
+
+# Units of the transfer and bandwidth columns. simpleperf counts in powers of 1000, iperf transfers in powers of 1024
+SIMPLEPERF_BYTES = {'b': 1, 'kb': 1000, 'mb': 1000**2}
+IPERF_BYTES = {'bytes': 1, 'kbytes': 1024, 'mbytes': 1024**2, 'gbytes': 1024**3}
+IPERF_BITS = {'bits/sec': 1e-6, 'kbits/sec': 1e-3, 'mbits/sec': 1, 'gbits/sec': 1e3}
+
+# Lines recognised in the three formats
+SIMPLEPERF_ROW = re.compile(r'^(\S.*?)\t+([\d.]+) - ([\d.]+)\t([\d.]+) (\w+)\t([\d.]+) Mbps')
+IPERF_ROW = re.compile(r'^\[\s*(\w+)\]\s+([\d.]+)-\s*([\d.]+) sec\s+([\d.]+) (\w+)\s+([\d.]+) (\w+/sec)'
+                       r'(?:\s+([\d.]+) ms\s+(\d+)/\s*(\d+))?')
+PING_REPLY = re.compile(r'icmp_seq=(\d+) .*time[=<]([\d.]+) ms')
+PING_SUMMARY = re.compile(r'(\d+) packets transmitted, (\d+) (?:packets )?received')
+RUN_SUFFIX = re.compile(r'-(\d+)$')
+
+# Test cases whose files without a -N suffix hold flows that ran at the same time, so their fairness is reported.
+# The other test cases run their flows one after the other
+CONCURRENT_CASES = ('test-case-5',)
+
+
+# Rows parsed from one file, as one array per column of every table, and the names of the flows they refer to
+class FileResult:
+    def __init__(self):
+        self.tables = {table: {column: array(typecode) for column, typecode in columns.items() if column not in LOCATION_COLUMNS}
+                       for table, columns in TABLES.items()}
+        self.flows = []
+        self.flowCodes = {}
+
+    def flow(self, name):
+        if name not in self.flowCodes:
+            self.flowCodes[name] = len(self.flows)
+            self.flows.append(name)
+        return self.flowCodes[name]
+
+    def append(self, table, **row):
+        for column, values in self.tables[table].items():
+            values.append(row.get(column, math.nan if values.typecode == 'd' else 0))
+
+
+# Define a function to turn the rows of one file into JSON values for the cache: its flow names and the bytes
+# of every column in base64
+def encode_result(result):
+    return {'flows': result.flows,
+            'tables': {table: {column: base64.b64encode(values.tobytes()).decode('ascii') for column, values in columns.items()}
+                       for table, columns in result.tables.items()}}
+
+# Define a function to rebuild the rows of one file from encode_result, with the typecodes of TABLES, raising
+# ValueError when the cached columns do not fit together
+def decode_result(data):
+    result = FileResult()
+    for name in data['flows']:
+        result.flow(str(name))
+    for table, columns in result.tables.items():
+        for column, values in columns.items():
+            values.frombytes(base64.b64decode(data['tables'][table][column], validate=True))
+        if len({len(values) for values in columns.values()}) > 1:
+            raise ValueError(f'columns of {table} differ in length')
+    if any(code < 0 or code >= len(result.flows) for code in result.tables['throughput']['flow']):
+        raise ValueError('flow code out of range')
+    return result
+
+
+# Define a function to parse one result file line by line
+def parse_file(path):
+    with open(path, errors='replace') as file:
+        return parse_lines(file)
+
+# Define a function to parse the lines of a result, recognising simpleperf tables and NDJSON, iperf output and
+# ping transcripts wherever they appear in it
+def parse_lines(lines):
+    result = FileResult()
+    simpleperfRows = [] # Kept until the end of the table, which tells whether they were intervals or totals
+    separatorAfterTable = False
+    inTable = False
+    iperfServerReport = False
+
+    for line in lines:
+        line = line.rstrip('\n')
+        if line.startswith('{'):
+            parse_json_row(result, line)
+        elif line.startswith('ID\t'):
+            inTable = True
+        elif line.startswith('---') and not line.startswith('--- '):
+            # simpleperf prints a separator between the interval rows and the totals
+            separatorAfterTable = separatorAfterTable or inTable and bool(simpleperfRows)
+        elif match := SIMPLEPERF_ROW.match(line):
+            flow, start, end, transfer, unit, mbps = match.groups()
+            simpleperfRows.append((flow.strip(), float(start), float(end), float(transfer) * SIMPLEPERF_BYTES.get(unit.lower(), 1),
+                                   float(mbps), separatorAfterTable))
+        elif line.endswith('Server Report:'):
+            iperfServerReport = True
+        elif match := IPERF_ROW.match(line):
+            flow, start, end, transfer, byteUnit, rate, bitUnit, jitter, lost, total = match.groups()
+            row = dict(flow=result.flow(f'iperf {flow}'), start=float(start), end=float(end), bytes=float(transfer) * IPERF_BYTES.get(byteUnit.lower(), 1),
+                       mbps=float(rate) * IPERF_BITS.get(bitUnit.lower(), 1), final=int(iperfServerReport))
+            if jitter is not None:
+                row.update(jitter=float(jitter), lost=int(lost), total=int(total))
+            result.append('throughput', **row)
+        elif match := PING_REPLY.search(line):
+            result.append('rtt', seq=int(match.group(1)), rtt=float(match.group(2)))
+        elif match := PING_SUMMARY.search(line):
+            result.append('ping', sent=int(match.group(1)), received=int(match.group(2)))
+
+    # Without -i every row is a total, with it only the rows after the separator are
+    for flow, start, end, data, mbps, afterSeparator in simpleperfRows:
+        result.append('throughput', flow=result.flow(flow), start=start, end=end, bytes=data, mbps=mbps,
+                      final=int(afterSeparator or not separatorAfterTable))
+
+    # iperf reports the receiver's view only when the server report arrived; otherwise the client's row is the total
+    if not any(result.tables['throughput']['final']) and len(result.tables['throughput']['final']):
+        final = result.tables['throughput']['final']
+        final[-1] = 1
+    return result
+
+# Define a function to add one NDJSON record of simpleperf --json to the throughput table
+def parse_json_row(result, line):
+    try:
+        record = json.loads(line)
+    except ValueError:
+        return
+    if record.get('type') not in ('interval', 'summary', 'interval_sum', 'summary_sum') or 'bits_per_second' not in record:
+        return
+    flow = '[SUM]' if record['type'].endswith('_sum') else record.get('stream', '')
+    result.append('throughput', flow=result.flow(flow), start=record['start'], end=record['end'], bytes=record['bytes'],
+                  mbps=record['bits_per_second'] / 1000**2, final=int(record['type'].startswith('summary')),
+                  jitter=record.get('jitter_ms', math.nan), lost=record.get('lost', 0), total=record.get('total', 0))
+
+
+# Columnar store of every parsed file: one flat array per column, which NumPy reads without copying. Names
+# of test cases, runs, files and flows are kept once in lists, and the columns hold their indexes
+class MeasurementStore:
+    def __init__(self):
+        self.tables = {table: {column: array(typecode) for column, typecode in columns.items()} for table, columns in TABLES.items()}
+        self.cases = []
+        self.runs = []
+        self.files = []
+        self.flows = []
+        self.caseCodes = {}
+        self.runCodes = {}
+
+    # Define a function to append the rows of one file, located in the tree by its test case and run
+    def add(self, case, run, path, result):
+        if case not in self.caseCodes:
+            self.caseCodes[case] = len(self.cases)
+            self.cases.append(case)
+        if (case, run) not in self.runCodes:
+            self.runCodes[(case, run)] = len(self.runs)
+            self.runs.append((case, run))
+        self.files.append(path)
+        location = {'case': self.caseCodes[case], 'run': self.runCodes[(case, run)], 'file': len(self.files) - 1}
+
+        for table, columns in result.tables.items():
+            rows = len(next(iter(columns.values())))
+            for column, values in self.tables[table].items():
+                if column in location:
+                    values.extend(array(values.typecode, [location[column]]) * rows)
+                elif column == 'flow':
+                    values.extend(code + len(self.flows) for code in columns[column])
+                else:
+                    values.extend(columns[column])
+        self.flows.extend(result.flows)
+
+    # Define a function to return a column as a NumPy array when NumPy is installed, or as the array itself
+    def column(self, table, name):
+        values = self.tables[table][name]
+        return np.frombuffer(values, dtype=values.typecode) if np is not None and len(values) else values
+
+    # Define a function to select the rows of a table for which 'column' equals 'code', optionally only the totals
+    def select(self, table, column, code, name, final=False):
+        values = self.column(table, name)
+        keys = self.column(table, column)
+        if np is not None and len(values):
+            mask = keys == code
+            if final:
+                mask &= self.column(table, 'final') == 1
+            return values[mask]
+        finals = self.tables[table]['final'] if final else None
+        return [value for i, (value, key) in enumerate(zip(values, keys)) if key == code and (finals is None or finals[i])]
+
+
+# Define a function to find the test case and run of a file: a trailing -N in its name marks the flows that ran
+# at the same time (test-case-4), and files without one are taken as one run of their test case. 'relative' is
+# the file's path below the root of the measurements tree
+def locate(relative):
+    case = relative.split(os.sep)[0] if os.sep in relative else '.'
+    match = RUN_SUFFIX.search(os.path.splitext(os.path.basename(relative))[0])
+    return case, match.group(1) if match else ''
+
+# Define a function to load every result file under 'root' into a store, reparsing only files whose mtime or
+# size changed since the cache was written
+def load(root, useCache=True):
+    cachePath = os.path.join(root, CACHE_NAME)
+    cache = {}
+    if useCache:
+        try:
+            with open(cachePath, encoding='utf-8') as file:
+                saved = json.load(file)
+            if saved.get('version') == CACHE_VERSION and isinstance(saved['files'], dict):
+                cache = saved['files']
+        except (OSError, ValueError, KeyError, AttributeError):
+            pass # No cache yet, or one of another version or format, which is written anew
+
+    store = MeasurementStore()
+    files = {}
+    changed = False
+    for directory, subdirectories, names in os.walk(root):
+        subdirectories.sort()
+        relativeDirectory = os.path.relpath(directory, root)
+        for name in sorted(names):
+            if not name.endswith('.txt'):
+                continue
+            path = os.path.join(directory, name)
+            status = os.stat(path)
+            key = name if relativeDirectory == os.curdir else os.path.join(relativeDirectory, name)
+            entry = cache.get(key)
+            result = None
+            if isinstance(entry, list) and entry[:2] == [status.st_mtime_ns, status.st_size]:
+                try:
+                    result = decode_result(entry[2])
+                except (ValueError, KeyError, TypeError, IndexError):
+                    pass # A damaged entry is parsed again
+            if result is None:
+                result = parse_file(path)
+                entry = [status.st_mtime_ns, status.st_size, encode_result(result)]
+                changed = True
+            files[key] = entry
+            store.add(*locate(key), key, result)
+
+    if useCache and (changed or files.keys() != cache.keys()):
+        try:
+            with open(cachePath, 'w', encoding='utf-8') as file:
+                json.dump({'version': CACHE_VERSION, 'files': files}, file, separators=(',', ':'))
+        except OSError:
+            pass # A read-only tree is analysed without a cache
+    return store
+
+
+# Define a function to compute a percentile with linear interpolation between the closest ranks, as NumPy does
+def percentile(values, p):
+    if np is not None:
+        return float(np.percentile(values, p))
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * p / 100
+    low = math.floor(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+# Define a function to compute Jain's fairness index of concurrent flows: 1 when all get the same throughput,
+# 1/n when one flow gets everything
+def jain_index(values):
+    if np is not None:
+        values = np.asarray(values, dtype=float)
+        total, squares = values.sum(), (values * values).sum()
+    else:
+        total, squares = sum(values), sum(value * value for value in values)
+    return float(total * total / (len(values) * squares)) if squares else math.nan
+
+# Define a function to compute Jain's index of every run at once from the run code and rate of each flow, as
+# a dict from run code to index for the runs of more than one flow
+def run_fairness(runs, rates):
+    if np is not None:
+        runs = np.asarray(runs, dtype=np.int64)
+        rates = np.asarray(rates, dtype=float)
+        counts = np.bincount(runs)
+        totals = np.bincount(runs, weights=rates)
+        squares = np.bincount(runs, weights=rates * rates)
+        return {int(run): float(totals[run] ** 2 / (counts[run] * squares[run])) if squares[run] else math.nan
+                for run in np.flatnonzero(counts > 1)}
+    grouped = {}
+    for run, rate in zip(runs, rates):
+        grouped.setdefault(run, []).append(rate)
+    return {run: jain_index(values) for run, values in grouped.items() if len(values) > 1}
+
+# Define a function to summarise a list of values with count, mean, spread and percentiles
+def describe(values):
+    if not len(values):
+        return None
+    if np is not None:
+        values = np.asarray(values, dtype=float)
+        summary = {'count': int(values.size), 'min': float(values.min()), 'mean': float(values.mean()), 'max': float(values.max()),
+                   'stdev': float(values.std())}
+    else:
+        mean = sum(values) / len(values)
+        summary = {'count': len(values), 'min': min(values), 'mean': mean, 'max': max(values),
+                   'stdev': math.sqrt(sum((value - mean)**2 for value in values) / len(values))}
+    summary.update({f'p{p}': percentile(values, p) for p in PERCENTILES})
+    return summary
+
+
+# Define a function to compute the statistics of every test case: throughput of the flows' totals, the fairness
+# of each run's concurrent flows, UDP jitter and loss, and the round-trip times and loss of the ping transcripts
+def analyse(store, concurrentCases=CONCURRENT_CASES):
+    # Totals of the single flows, leaving out the [SUM] rows of parallel streams (per direction with --bidir), in one pass over the table
+    final = store.column('throughput', 'final')
+    flows = store.column('throughput', 'flow')
+    if np is not None and len(final):
+        isSum = np.array([name.startswith('[SUM]') for name in store.flows], dtype=bool)
+        single = (final == 1) & ~isSum[flows]
+        cases, runs, rates = (store.column('throughput', name)[single] for name in ('case', 'run', 'mbps'))
+    else:
+        rows = [i for i, (isFinal, flow) in enumerate(zip(final, flows)) if isFinal and not store.flows[flow].startswith('[SUM]')]
+        cases, runs, rates = ([store.tables['throughput'][name][i] for i in rows] for name in ('case', 'run', 'mbps'))
+    fairnessByRun = run_fairness(runs, rates)
+
+    results = {}
+    for code, case in enumerate(store.cases):
+        throughput = rates[cases == code] if np is not None and len(final) else [rate for rateCase, rate in zip(cases, rates) if rateCase == code]
+        # Fairness only compares flows known to have run together: those of a -N run, or of a concurrent test case
+        fairness = {run or case: fairnessByRun[runCode] for runCode, (runCase, run) in enumerate(store.runs)
+                    if runCase == case and runCode in fairnessByRun and (run or case in concurrentCases)}
+
+        jitter = [value for value in store.select('throughput', 'case', code, 'jitter', final=True) if not math.isnan(value)]
+        lost = store.select('throughput', 'case', code, 'lost', final=True)
+        total = store.select('throughput', 'case', code, 'total', final=True)
+        sent = store.select('ping', 'case', code, 'sent')
+        received = store.select('ping', 'case', code, 'received')
+
+        results[case] = {
+            'flows': len(throughput),
+            'throughput_mbps': describe(throughput),
+            'fairness': fairness,
+            'udp_jitter_ms': describe(jitter),
+            'udp_loss_percent': 100 * float(sum(lost)) / float(sum(total)) if sum(total) else None,
+            'rtt_ms': describe(store.select('rtt', 'case', code, 'rtt')),
+            'ping_loss_percent': 100 * (1 - float(sum(received)) / float(sum(sent))) if sum(sent) else None,
+        }
+    return results
+
+
+# Define a function to print the statistics of every test case as a text report
+def print_report(results):
+    for case, stats in results.items():
+        print('------------------------------------------------------------')
+        print(f'{case}')
+        print('------------------------------------------------------------')
+        for label, key, unit in (('Throughput', 'throughput_mbps', 'Mbps'), ('UDP jitter', 'udp_jitter_ms', 'ms'), ('RTT', 'rtt_ms', 'ms')):
+            summary = stats[key]
+            if summary:
+                percentiles = '  '.join(f"p{p} {summary[f'p{p}']:.2f}" for p in PERCENTILES)
+                print(f"{label:<12}n={summary['count']:<4} mean {summary['mean']:.2f} {unit}  min {summary['min']:.2f}  {percentiles}  max {summary['max']:.2f}")
+        if stats['udp_loss_percent'] is not None:
+            print(f"{'UDP loss':<12}{stats['udp_loss_percent']:.2f}%")
+        if stats['ping_loss_percent'] is not None:
+            print(f"{'Ping loss':<12}{stats['ping_loss_percent']:.2f}%")
+        for run, index in stats['fairness'].items():
+            print(f"{'Fairness':<12}run {run}: Jain's index {index:.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Summarise the simpleperf, iperf and ping results under a measurements tree')
+    parser.add_argument('root', nargs='?', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'measurements'),
+                        help='Enter the measurements directory, with one folder per test case (Default - ../measurements).')
+    parser.add_argument('-J', '--json', action='store_true', help='Print the statistics as JSON instead of text.')
+    parser.add_argument('--no-cache', action='store_true', help=f'Parse every file again, without reading or writing {CACHE_NAME}.')
+    parser.add_argument('--concurrent', nargs='*', default=list(CONCURRENT_CASES), help=f"Enter the test cases whose files without a -N suffix ran at the same time (Default - {' '.join(CONCURRENT_CASES)}).")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.root):
+        print(f'Error: {args.root} is not a directory')
+        sys.exit(1)
+    results = analyse(load(args.root, useCache=not args.no_cache), concurrentCases=args.concurrent)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_report(results)
+
+
+if __name__ == '__main__':
+    main()
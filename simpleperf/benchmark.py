@@ -0,0 +1,237 @@
+import argparse
+import datetime
+import itertools
+import json
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+# simpleperf is run as separate server and client processes, exactly as it is used, from the same folder
+SIMPLEPERF = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'simpleperf.py')
+
+# Engine setups of the matrix, as the options given to the server and to the client
+ENGINES = {
+    'threaded': (['-e', 'threaded'], ['-e', 'threaded']),
+    'selectors': (['-e', 'selectors'], ['-e', 'threaded']),
+    'asyncio': (['-e', 'selectors'], ['-e', 'asyncio']),
+    'workers': (['-e', 'selectors', '-w', '2'], ['-e', 'threaded', '-w', '2']),
+}
+
+# Metrics of a point, and whether a higher value is better
+METRICS = {'gbps': True, 'cpu_per_gb': False, 'calls_per_gb': False}
+
+SERVER_START_TIMEOUT = 5 # Seconds to wait for the server to listen
+SERVER_REPORT_DELAY = 0.2 # Seconds the server is given to print its last results before it is stopped
+CLIENT_ATTEMPTS = 3 # Times the client is started before a point is given up, in case it raced the server's listen
+STARTUP_SAMPLES = 3 # Times simpleperf is started and exits at once to measure what starting the interpreter costs
+
+
+# Define a function to find a free TCP port on the loopback interface, within the range simpleperf accepts
+def free_port():
+    while True:
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as probe:
+            probe.bind(('127.0.0.1', 0))
+            port = probe.getsockname()[1]
+        if port >= 1024:
+            return port
+
+# Define a function to wait until the server has bound its port. Binding the same port fails once it has,
+# which tells without connecting, so the server never sees a connection that is not a test
+def wait_listening(port, process):
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    while time.monotonic() < deadline and process.poll() is None:
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as probe:
+            try:
+                probe.bind(('127.0.0.1', port))
+            except OSError:
+                return True
+        time.sleep(0.02)
+    return False
+
+# Define a function to wait for a process and return its output with the CPU seconds (user and system) used by
+# it and the worker processes it waited for, as os.wait4 reports them
+def finish(process):
+    output = process.stdout.read()
+    _, status, usage = os.wait4(process.pid, 0)
+    process.returncode = os.waitstatus_to_exitcode(status)
+    return output, usage.ru_utime + usage.ru_stime
+
+# Define a function to measure the CPU seconds of a simpleperf process that starts and exits without testing.
+# Every point leaves it out of both processes, so the CPU per GB counts the transfer and not the interpreter start
+def startup_cpu():
+    samples = []
+    for _ in range(STARTUP_SAMPLES):
+        process = subprocess.Popen([sys.executable, SIMPLEPERF, '-h'], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+        samples.append(finish(process)[1])
+    return min(samples)
+
+# Define a function to read the NDJSON summary records of simpleperf --json from its output
+def summaries(output):
+    records = []
+    for line in output.splitlines():
+        if line.startswith('{'):
+            record = json.loads(line)
+            if record.get('type') == 'summary':
+                records.append(record)
+    return records
+
+
+# Define a function to run one point of the matrix and return its metrics, or None if it failed
+def run_point(point, args, startupCpu):
+    serverOptions, clientOptions = ENGINES[point['engine']]
+    length = ['-l', point['length']]
+    limit = ['-t', str(args.time)] if point['mode'] == 'time' else ['-n', args.num]
+    port = free_port()
+
+    server = subprocess.Popen([sys.executable, SIMPLEPERF, '-s', '-p', str(port), '-J', *length, *serverOptions],
+                              stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    try:
+        if not wait_listening(port, server):
+            print(f"Error: the server for {point_name(point)} did not start")
+            return None
+        for _ in range(CLIENT_ATTEMPTS):
+            client = subprocess.Popen([sys.executable, SIMPLEPERF, '-c', '-p', str(port), '-J', '-P', str(point['parallel']), *length, *limit, *clientOptions],
+                                      stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+            clientOutput, clientCpu = finish(client)
+            if client.returncode == 0:
+                break
+            time.sleep(0.1)
+        else:
+            print(f"Error: the client for {point_name(point)} failed")
+            return None
+    finally:
+        # The server prints a result just after its stats record reaches the client, and runs until interrupted
+        time.sleep(SERVER_REPORT_DELAY)
+        server.send_signal(signal.SIGINT)
+        serverOutput, serverCpu = finish(server)
+
+    clientRecords = summaries(clientOutput)
+    if not clientRecords:
+        return None
+    # Worker processes are forked, so each side started one interpreter whatever the engine
+    clientCpu = max(clientCpu - startupCpu, 0)
+    serverCpu = max(serverCpu - startupCpu, 0)
+    data = sum(record['bytes'] for record in clientRecords)
+    elapsedTime = max(record['end'] for record in clientRecords)
+    calls = sum(record.get('calls', 0) for record in clientRecords + summaries(serverOutput))
+    gigabytes = data / 1000**3
+    return {
+        'gbps': data * 8 / elapsedTime / 1000**3 if elapsedTime else 0,
+        'cpu_per_gb': (clientCpu + serverCpu) / gigabytes if gigabytes else 0,
+        'client_cpu': clientCpu,
+        'server_cpu': serverCpu,
+        'calls_per_gb': calls / gigabytes if gigabytes else 0,
+        'bytes': data,
+    }
+
+
+# Define a function to run the whole matrix 'repeat' times, one round after the other so a slow spell of the host
+# is spread over every point, and return the median of every metric by point name, or None for a point with
+# any failed run. One noisy run cannot move a median
+def run_rounds(points, args, startupCpu):
+    samples = {point_name(point): [] for point in points}
+    for _ in range(args.repeat):
+        for point in points:
+            samples[point_name(point)].append(run_point(point, args, startupCpu))
+    return {name: None if None in runs else {metric: statistics.median(run[metric] for run in runs) for metric in runs[0]}
+            for name, runs in samples.items()}
+
+
+# Define a function to name a point of the matrix, used as its key in the history and the baseline
+def point_name(point):
+    return f"{point['engine']} -l {point['length']} -P {point['parallel']} {point['mode']}"
+
+# Define a function to compare a run with the baseline, returning a line for every metric worse than the threshold
+# and for every point of the baseline that gave no result
+def regressions(results, baseline, threshold):
+    found = []
+    for name, reference in baseline.items():
+        metrics = results.get(name)
+        if metrics is None:
+            found.append(f'{name}: no result')
+            continue
+        for metric, higherIsBetter in METRICS.items():
+            old, new = reference.get(metric), metrics[metric]
+            if not old:
+                continue
+            change = (new - old) / old
+            if (-change if higherIsBetter else change) > threshold:
+                found.append(f'{name}: {metric} {old:.2f} -> {new:.2f} ({change * 100:+.1f}%)')
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark simpleperf over 127.0.0.1 across block sizes, streams, engines and modes')
+    parser.add_argument('--lengths', nargs='+', default=['8KB', '128KB', '1MB'], help='Enter the block sizes -l to run (Default - 8KB 128KB 1MB).')
+    parser.add_argument('--parallel', nargs='+', type=int, default=[1, 4], help='Enter the parallel stream counts -P to run (Default - 1 4).')
+    parser.add_argument('--engines', nargs='+', choices=list(ENGINES), default=list(ENGINES), help='Enter the engine setups to run (Default - all).')
+    parser.add_argument('--modes', nargs='+', choices=['time', 'num'], default=['time', 'num'], help='Enter -t and/or -n runs (Default - both).')
+    parser.add_argument('-t', '--time', type=int, default=2, help='Enter the duration of each -t run in seconds (Default - 2).')
+    parser.add_argument('-n', '--num', type=str, default='500MB', help='Enter the total size of each -n run (Default - 500MB).')
+    parser.add_argument('--history', type=str, default='benchmark-history.jsonl', help='Enter the file every result is appended to (Default - benchmark-history.jsonl).')
+    parser.add_argument('--baseline', type=str, default='benchmark-baseline.json', help='Enter the baseline file to compare against (Default - benchmark-baseline.json).')
+    parser.add_argument('--save-baseline', action='store_true', help='Store the results of this run as the new baseline.')
+    parser.add_argument('--repeat', type=int, default=3, help='Enter how many times each point is run, the median being compared (Default - 3).')
+    parser.add_argument('--threshold', type=float, default=0.10, help='Enter the relative change counted as a regression, i.e. 0.1 for 10%% (Default - 0.10).')
+    args = parser.parse_args()
+    if args.repeat < 1:
+        parser.error('--repeat must be at least 1.')
+
+    points = [dict(zip(('engine', 'length', 'parallel', 'mode'), values))
+              for values in itertools.product(args.engines, args.lengths, args.parallel, args.modes)]
+    timestamp = datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds')
+
+    startupCpu = startup_cpu()
+    print(f'Interpreter start of {startupCpu:.3f} CPU s left out of each process')
+    medians = run_rounds(points, args, startupCpu)
+    print(f'Median of {args.repeat} run(s) of each point')
+    print('Point\t\t\t\t\tGb/s\tCPU s/GB\tcalls/GB')
+    results = {}
+    failed = []
+    with open(args.history, 'a') as history:
+        for point in points:
+            name = point_name(point)
+            metrics = medians[name]
+            if metrics is None:
+                failed.append(name)
+                print(f'{name:<40}no result')
+                continue
+            results[name] = metrics
+            print(f"{name:<40}{metrics['gbps']:.2f}\t{metrics['cpu_per_gb']:.3f}\t\t{metrics['calls_per_gb']:.0f}", flush=True)
+            history.write(json.dumps({'time': timestamp, 'point': name, **point, 'repeat': args.repeat, **metrics}) + '\n')
+
+    # A point without a result could hide any regression, so it fails the run whatever the baseline holds
+    if args.save_baseline:
+        if failed:
+            print(f'Error: {len(failed)} point(s) gave no result, the baseline in {args.baseline} is left as it was')
+            sys.exit(1)
+        with open(args.baseline, 'w') as file:
+            json.dump(results, file, indent=2)
+        print(f'Baseline of {len(results)} points saved to {args.baseline}')
+        return
+
+    try:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+    except FileNotFoundError:
+        print(f'No baseline in {args.baseline}, run with --save-baseline to store one')
+        sys.exit(1 if failed else 0)
+    # Only the baseline's points of the matrix asked for are compared, so a smaller matrix can be run on its own
+    requested = {point_name(point) for point in points}
+    found = regressions(results, {name: metrics for name, metrics in baseline.items() if name in requested}, args.threshold)
+    found += [f'{name}: no result' for name in failed if name not in baseline]
+    print('------------------------------------------------------------')
+    if found:
+        print(f'{len(found)} regression(s) beyond {args.threshold * 100:.0f}% or missing point(s) against {args.baseline}:')
+        for line in found:
+            print(line)
+        sys.exit(1)
+    print(f'No regressions beyond {args.threshold * 100:.0f}% against {args.baseline}')
+
+
+if __name__ == '__main__':
+    main()
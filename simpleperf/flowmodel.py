@@ -0,0 +1,384 @@
+import argparse
+import ast
+import itertools
+import math
+import os
+import re
+import sys
+import time
+
+import analysis
+from scenario import load_scenario
+from simpleperf import UDP_DEFAULT_BITRATE, parse_rate
+
+# NumPy evaluates every flow mix at once; without it each mix is filled in turn with the standard library
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# The topology is read from the Mininet script next to this folder, without importing Mininet
+TOPOLOGY = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'portfolio-topology.py')
+TOPOLOGY_CLASS = 'PortfolioNetwork2410'
+MEASUREMENTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'measurements')
+
+PACKET_BITS = 1500 * 8 # Size of a queued packet, the MTU of the links
+TOLERANCE = 1e-9 # Share of a link's capacity still counted as free
+
+# Defaults of the tools in a scenario when a duration is not given
+SIMPLEPERF_TIME = 25
+IPERF_TIME = 10
+PING_COUNT = 5
+
+DELAY_UNITS = {'us': 1e-6, 'ms': 1e-3, 's': 1}
+DELAY = re.compile(r'^([\d.]+)\s*(us|ms|s)?$')
+FLOW = re.compile(r'^(\w+)-(\w+?)(?:x(\d+))?(?:@([\d.]+[KMG]?))?$', re.IGNORECASE)
+
+
+# The links of a topology as directed links: link i is 2i from its first node to its second and 2i + 1 back.
+# Each direction has its own capacity and queue, as TCLink shapes both ends of a link
+class Network:
+    def __init__(self, hosts, links):
+        self.hosts = hosts
+        self.links = links
+        self.names = []
+        self.capacity = [] # Mbps, inf for links without a bw
+        self.delay = [] # One-way delay in seconds
+        self.queueDelay = [] # Seconds to drain a full queue
+        self.neighbours = {}
+        self.routes = {}
+        for index, link in enumerate(links):
+            a, b = link['nodes']
+            self.neighbours.setdefault(a, []).append((b, 2 * index))
+            self.neighbours.setdefault(b, []).append((a, 2 * index + 1))
+            for first, second in ((a, b), (b, a)):
+                self.names.append(f'{first}->{second}')
+                self.capacity.append(link['bw'] or math.inf)
+                self.delay.append(link['delay'])
+                self.queueDelay.append(link['queue'] * PACKET_BITS / (link['bw'] * 1e6) if link['bw'] and link['queue'] else 0)
+
+    # Define a function to find the directed links from one node to another. The topology is a tree, so the
+    # path found breadth first is the one the static routes take
+    def route(self, source, destination):
+        if (source, destination) not in self.routes:
+            previous = {source: None}
+            queue = [source]
+            for node in queue:
+                for neighbour, link in self.neighbours.get(node, []):
+                    if neighbour not in previous:
+                        previous[neighbour] = (node, link)
+                        queue.append(neighbour)
+            if destination not in previous:
+                raise ValueError(f'No path from {source} to {destination}')
+            path = []
+            node = destination
+            while previous[node]:
+                node, link = previous[node]
+                path.append(link)
+            self.routes[source, destination] = path[::-1]
+        return self.routes[source, destination]
+
+
+# Define a function to convert a Mininet delay such as '10ms' to seconds
+def parse_delay(delay):
+    match = DELAY.match(str(delay).strip())
+    if not match:
+        raise ValueError(f'Invalid delay {delay}')
+    return float(match.group(1)) * DELAY_UNITS[match.group(2) or 'us']
+
+# Define a function to read the hosts and links of a Mininet topology class from its source. Nodes are found by
+# the variables addHost, addSwitch and addNode are assigned to, and loops over a tuple of nodes are unrolled
+def read_topology(path=TOPOLOGY, className=TOPOLOGY_CLASS):
+    with open(path) as file:
+        tree = ast.parse(file.read(), path)
+    topology = next((node for node in tree.body if isinstance(node, ast.ClassDef) and node.name == className), None)
+    build = next((node for node in topology.body if isinstance(node, ast.FunctionDef) and node.name == 'build'), None) if topology else None
+    if build is None:
+        raise ValueError(f'No {className}.build in {path}')
+
+    nodes = {}
+    hosts = []
+    links = []
+
+    def node_name(expression, bindings):
+        if isinstance(expression, ast.Name):
+            return bindings.get(expression.id, nodes.get(expression.id))
+        return ast.literal_eval(expression)
+
+    def visit(statements, bindings):
+        for statement in statements:
+            if isinstance(statement, ast.For) and isinstance(statement.target, ast.Name) and isinstance(statement.iter, (ast.Tuple, ast.List)):
+                for element in statement.iter.elts:
+                    visit(statement.body, {**bindings, statement.target.id: node_name(element, bindings)})
+                continue
+            call = statement.value if isinstance(statement, (ast.Assign, ast.Expr)) else None
+            if not (isinstance(call, ast.Call) and isinstance(call.func, ast.Attribute)):
+                continue
+            method = call.func.attr
+            if method in ('addHost', 'addSwitch', 'addNode'):
+                name = ast.literal_eval(call.args[0])
+                if isinstance(statement, ast.Assign):
+                    nodes[statement.targets[0].id] = name
+                if method == 'addHost':
+                    hosts.append(name)
+            elif method == 'addLink':
+                options = {keyword.arg: ast.literal_eval(keyword.value) for keyword in call.keywords if keyword.arg in ('bw', 'delay', 'max_queue_size')}
+                links.append({'nodes': (node_name(call.args[0], bindings), node_name(call.args[1], bindings)),
+                              'bw': options.get('bw'), 'delay': parse_delay(options.get('delay', 0)), 'queue': options.get('max_queue_size')})
+
+    visit(build.body, {})
+    return Network(hosts, links)
+
+
+# Define a function to fill one mix of flows max-min fairly. Every unfrozen flow grows at the same pace until
+# a link it crosses is full or it reaches its demand, and is then frozen at that rate; flows without a demand
+# (inf) are elastic like TCP, flows with a demand are capped like UDP at a bitrate, and a demand of 0 is a probe
+def fill(routes, capacity, demands):
+    rates = [0.0] * len(routes)
+    active = [demand > 0 for demand in demands]
+    remaining = list(capacity)
+    while any(active):
+        counts = {}
+        for flow, route in enumerate(routes):
+            if active[flow]:
+                for link in route:
+                    if capacity[link] != math.inf:
+                        counts[link] = counts.get(link, 0) + 1
+        step = min([remaining[link] / count for link, count in counts.items()] +
+                   [demands[flow] - rates[flow] for flow in range(len(routes)) if active[flow]])
+        for flow in range(len(routes)):
+            if active[flow]:
+                rates[flow] += step
+        for link, count in counts.items():
+            remaining[link] -= step * count
+        full = {link for link in counts if remaining[link] <= capacity[link] * TOLERANCE}
+        for flow, route in enumerate(routes):
+            if active[flow] and (step == math.inf or rates[flow] >= demands[flow] * (1 - TOLERANCE) or full.intersection(route)):
+                active[flow] = False
+    saturated = [capacity[link] != math.inf and remaining[link] <= capacity[link] * TOLERANCE for link in range(len(capacity))]
+    return rates, saturated
+
+# Define a function to fill every mix at once with NumPy, as fill does for one. routes is a boolean array of
+# mixes x flows x directed links, and the loop runs at most once per flow of the widest mix
+def fill_batch(routes, capacity, demands):
+    limited = routes & np.isfinite(capacity)
+    rates = np.zeros(demands.shape)
+    active = demands > 0
+    remaining = np.broadcast_to(capacity, (routes.shape[0], capacity.size)).copy()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        while active.any():
+            counts = np.einsum('mfl,mf->ml', limited, active, dtype=float)
+            linkStep = np.where(counts > 0, remaining / counts, np.inf).min(axis=1)
+            demandStep = np.where(active, demands - rates, np.inf).min(axis=1)
+            step = np.minimum(linkStep, demandStep)[:, None]
+            rates = np.where(active, rates + step, rates)
+            remaining = np.where(counts > 0, remaining - step * counts, remaining)
+            full = remaining <= capacity * TOLERANCE
+            blocked = np.einsum('mfl,ml->mf', limited, full) > 0
+            active &= ~(np.isinf(step) | (rates >= demands * (1 - TOLERANCE)) | blocked)
+    return rates, np.isfinite(capacity) & (remaining <= capacity * TOLERANCE)
+
+
+# Define a function to evaluate mixes of concurrent flows, each a list of (source, destination, demand in Mbps).
+# Returns the rate of every flow in Mbps, its round-trip time without queueing and its round-trip time with the
+# queues of the links the mix saturates kept full, as loss-based TCP keeps them, and the saturated links. Rows
+# are padded with nan to the widest mix; they are NumPy arrays when NumPy is installed, else lists
+def evaluate(network, mixes):
+    width = max((len(mix) for mix in mixes), default=0)
+    capacity, delay, queueDelay = network.capacity, network.delay, network.queueDelay
+
+    if np is not None:
+        links = len(capacity)
+        # Each distinct pair of nodes gets a row of its links, and the mixes index those rows; row 0 is the padding
+        pairs = {}
+        indexes = [[pairs.setdefault((source, destination), len(pairs) + 1) for source, destination, _ in mix] + [0] * (width - len(mix)) for mix in mixes]
+        masks = np.zeros((len(pairs) + 1, links), dtype=bool)
+        for (source, destination), row in pairs.items():
+            masks[row, network.route(source, destination)] = True
+        indexes = np.array(indexes, dtype=np.intp).reshape(len(mixes), width)
+        routes = masks[indexes]
+        valid = indexes > 0
+        demands = np.array([[demand for _, _, demand in mix] + [0] * (width - len(mix)) for mix in mixes], dtype=float).reshape(len(mixes), width)
+        capacity, delay, queueDelay = np.array(capacity), np.array(delay), np.array(queueDelay)
+        rates, saturated = fill_batch(routes, capacity, demands)
+        reverse = routes[:, :, np.arange(links) ^ 1]
+        baseRtt = (routes | reverse) @ delay * 1000
+        queueing = np.einsum('mfl,ml->mf', routes | reverse, saturated * queueDelay) * 1000
+        nan = np.where(valid, 1.0, np.nan)
+        return rates * nan, baseRtt * nan, (baseRtt + queueing) * nan, saturated
+
+    results = ([], [], [], [])
+    for mix in mixes:
+        routes = [network.route(source, destination) for source, destination, _ in mix]
+        rates, saturated = fill(routes, capacity, [demand for _, _, demand in mix])
+        both = [route + [link ^ 1 for link in route] for route in routes]
+        baseRtt = [sum(delay[link] for link in route) * 1000 for route in both]
+        loadedRtt = [rtt + sum(queueDelay[link] for link in route if saturated[link]) * 1000 for rtt, route in zip(baseRtt, both)]
+        padding = [math.nan] * (width - len(mix))
+        for result, row in zip(results, (rates, baseRtt, loadedRtt, saturated)):
+            result.append(row + padding if row is not saturated else row)
+    return results
+
+
+# Define a function to parse a flow given on the command line: h1-h4, h1-h4x2 for two streams, h1-h4@28M for
+# a UDP flow at 28 Mbps. Each stream is a flow of its own
+def parse_flow(text):
+    match = FLOW.match(text)
+    if not match:
+        raise argparse.ArgumentTypeError(f'{text} is not a flow such as h1-h4, h1-h4x2 or h1-h4@28M')
+    source, destination, streams, rate = match.groups()
+    demand = parse_rate(rate if rate[-1:].isalpha() else rate + 'M') / 1000**2 if rate else math.inf
+    return [(source, destination, demand)] * int(streams or 1)
+
+# Define a function to find the flows of a scenario's clients and commands. simpleperf clients and iperf clients
+# carry data; ping commands are probes with a demand of 0, whose round-trip time is predicted. Returns
+# (start, end, output, flows) for every transfer
+def scenario_transfers(scenario):
+    options = argparse.ArgumentParser(add_help=False)
+    options.add_argument('-c', '--client')
+    options.add_argument('-P', '--parallel', type=int, default=1)
+    options.add_argument('-u', '--udp', action='store_true')
+    options.add_argument('-b', '--bitrate')
+    options.add_argument('-t', '--time', type=int)
+    options.add_argument('-R', '--reverse', action='store_true')
+    options.add_argument('--bidir', action='store_true')
+    pingOptions = argparse.ArgumentParser(add_help=False)
+    pingOptions.add_argument('-c', '--count', type=int, default=PING_COUNT)
+
+    def host_of(argument):
+        return argument.strip('{}')
+
+    transfers = []
+    for client in scenario.get('clients', []):
+        args, _ = options.parse_known_args(client.get('args', []))
+        bitrate = parse_rate(args.bitrate) if args.bitrate else (UDP_DEFAULT_BITRATE if args.udp else 0)
+        demand = bitrate / 1000**2 if bitrate else math.inf
+        forward = (client['host'], client['server'], demand)
+        backward = (client['server'], client['host'], demand)
+        flows = [backward if args.reverse else forward] * args.parallel + ([backward] * args.parallel if args.bidir else [])
+        start = client.get('start', 0)
+        transfers.append((start, start + (args.time or SIMPLEPERF_TIME), client.get('output'), flows))
+
+    for command in scenario.get('commands', []):
+        cmd = command['cmd']
+        start = command.get('start', 0)
+        if cmd[0] == 'iperf':
+            args, _ = options.parse_known_args(cmd[1:])
+            if args.client is None:
+                continue # iperf -s only receives
+            demand = parse_rate(args.bitrate or '1M') / 1000**2 if args.udp else math.inf
+            flows = [(command['host'], host_of(args.client), demand)] * args.parallel
+            transfers.append((start, start + (args.time or IPERF_TIME), command.get('output'), flows))
+        elif cmd[0] == 'ping':
+            args, rest = pingOptions.parse_known_args(cmd[1:])
+            transfers.append((start, start + args.count, command.get('output'), [(command['host'], host_of(rest[0]), 0)]))
+    return transfers
+
+# Define a function to split a scenario into phases: at each time a transfer starts, the transfers running
+# together. Returns (time, transfers) for every phase
+def scenario_phases(scenario):
+    transfers = scenario_transfers(scenario)
+    return [(start, [transfer for transfer in transfers if transfer[0] <= start < transfer[1]])
+            for start in sorted({transfer[0] for transfer in transfers})]
+
+
+# Define a function to print the prediction of one mix, a line per flow with the saturated links it crosses
+def print_mix(network, mix, labels=None):
+    rates, baseRtt, loadedRtt, saturated = (result[0] for result in evaluate(network, [mix]))
+    for f, (source, destination, demand) in enumerate(mix):
+        saturatedLinks = ' '.join(network.names[link] for link in network.route(source, destination) if saturated[link]) or '-'
+        label = labels[f] if labels else f'{source} -> {destination}'
+        offered = f'{demand:.2f} Mbps offered' if 0 < demand < math.inf else ('probe' if demand == 0 else 'elastic')
+        print(f'{label:<24}{rates[f]:>8.2f} Mbps\tRTT {baseRtt[f]:.1f} ms\tloaded {loadedRtt[f]:.1f} ms\t{offered:<20}saturated {saturatedLinks}')
+
+# Define a function to print the prediction of every phase of a scenario, next to the measured result of each
+# transfer's output file when a measurements tree holds it
+def print_scenario(network, name, root=None):
+    scenario = load_scenario(name)
+    base = os.path.splitext(os.path.basename(name))[0]
+    folders = [os.path.join(root, base), os.path.join(root, analysis.RUN_SUFFIX.sub('', base))] if root else []
+    print('------------------------------------------------------------')
+    print(f"{base}: {scenario.get('description', '')}")
+    print('------------------------------------------------------------')
+    print(f"{'Output':<36}{'Predicted':>12}{'Measured':>12}\t(Mbps for transfers, average RTT in ms for pings)")
+    for start, transfers in scenario_phases(scenario):
+        mix = [flow for transfer in transfers for flow in transfer[3]]
+        rates, _, loadedRtt, _ = (result[0] for result in evaluate(network, [mix]))
+        print(f'At {start} s:')
+        first = 0
+        for transferStart, _, output, flows in transfers:
+            streams = range(first, first + len(flows))
+            first += len(flows)
+            if transferStart != start:
+                continue # Already printed in the phase it started in
+            probe = flows[0][2] == 0
+            predicted = loadedRtt[streams[0]] if probe else sum(rates[f] for f in streams)
+            measured = measured_value(folders, output, probe)
+            print(f"  {output or '-':<34}{predicted:>12.2f}{measured:>12.2f}" if measured is not None else f"  {output or '-':<34}{predicted:>12.2f}{'-':>12}")
+
+# Define a function to read the measured result of a transfer from its output file: the sum of the streams'
+# totals in Mbps, or the average round-trip time in ms of a ping
+def measured_value(folders, output, probe):
+    for folder in folders:
+        path = os.path.join(folder, output) if output else ''
+        if os.path.isfile(path):
+            result = analysis.parse_file(path)
+            if probe:
+                rtt = result.tables['rtt']['rtt']
+                return sum(rtt) / len(rtt) if len(rtt) else None
+            throughput = result.tables['throughput']
+            totals = [mbps for flow, mbps, final in zip(throughput['flow'], throughput['mbps'], throughput['final'])
+                      if final and not result.flows[flow].startswith('[SUM]')]
+            return sum(totals) if totals else None
+    return None
+
+
+# Define a function to evaluate every combination of a number of flows between the given hosts, and print the
+# time it took with the mixes whose slowest flow gets the lowest rate
+def print_combinations(network, hosts, size, top):
+    pairs = [(source, destination, math.inf) for source, destination in itertools.permutations(hosts, 2)]
+    mixes = [list(mix) for mix in itertools.combinations(pairs, size)]
+    startTime = time.perf_counter()
+    rates = evaluate(network, mixes)[0]
+    elapsedTime = time.perf_counter() - startTime
+    lowest = rates.min(axis=1) if np is not None else [min(row) for row in rates]
+    order = np.argsort(lowest, kind='stable')[:top] if np is not None else sorted(range(len(mixes)), key=lowest.__getitem__)[:top]
+    print(f'{len(mixes)} mixes of {size} flows evaluated in {elapsedTime:.3f} s ({"NumPy" if np is not None else "standard library"})')
+    for m in order:
+        flows = ', '.join(f'{source}-{destination}' for source, destination, _ in mixes[m])
+        print(f'{flows:<40}lowest {lowest[m]:.2f} Mbps\tJain {analysis.jain_index(list(rates[m])):.3f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=f'Predict max-min fair throughput and round-trip times of concurrent flows on {TOPOLOGY_CLASS} without Mininet')
+    parser.add_argument('flows', nargs='*', type=parse_flow, help='Enter concurrent flows as SRC-DST, with xN for N streams and @RATE for a UDP flow, i.e. h1-h4x2 h7-h9@20M.')
+    parser.add_argument('--scenario', nargs='+', default=[], help='Enter scenarios, by file or by name in the scenarios folder, to predict phase by phase.')
+    parser.add_argument('--measurements', type=str, default=MEASUREMENTS, help='Enter the measurements tree the scenarios are compared with (Default - ../measurements).')
+    parser.add_argument('--combinations', type=int, default=0, help='Enter a number of flows to evaluate every combination of that many flows between the hosts (Default - 0).')
+    parser.add_argument('--hosts', nargs='+', default=None, help='Enter the hosts of --combinations (Default - every host).')
+    parser.add_argument('--top', type=int, default=10, help='Enter how many of the --combinations mixes with the lowest rate to print (Default - 10).')
+    parser.add_argument('--topology', type=str, default=TOPOLOGY, help='Enter the Mininet script to read the topology from (Default - ../portfolio-topology.py).')
+    args = parser.parse_args()
+
+    network = read_topology(args.topology)
+    if not (args.flows or args.scenario or args.combinations):
+        print(f'{"Link":<12}{"Mbps":>8}{"Delay ms":>10}{"Queue":>8}{"Full queue ms":>15}')
+        for index, link in enumerate(network.links):
+            if link['bw']:
+                print(f"{network.names[2 * index]:<12}{link['bw']:>8}{link['delay'] * 1000:>10.1f}{link['queue'] or '-':>8}{network.queueDelay[2 * index] * 1000:>15.1f}")
+        return
+
+    try:
+        if args.flows:
+            print_mix(network, [flow for flows in args.flows for flow in flows])
+        for name in args.scenario:
+            print_scenario(network, name, args.measurements if os.path.isdir(args.measurements) else None)
+        if args.combinations:
+            print_combinations(network, args.hosts or network.hosts, args.combinations, args.top)
+    except (ValueError, FileNotFoundError) as error:
+        print(f'Error: {error}')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
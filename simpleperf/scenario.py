@@ -0,0 +1,376 @@
+import argparse
+import importlib.util
+import itertools
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+from queue import Queue
+
+import analysis
+from simpleperf import DAEMON_PORT
+
+# simpleperf and the topology are found relative to this file, the scenarios next to them in the repository
+HERE = os.path.dirname(os.path.abspath(__file__))
+SIMPLEPERF = os.path.join(HERE, 'simpleperf.py')
+TOPOLOGY = os.path.join(HERE, os.pardir, 'portfolio-topology.py')
+SCENARIOS = os.path.join(HERE, os.pardir, 'scenarios')
+
+DEFAULT_PORT = 8088
+SERVER_WARMUP = 1.0 # Seconds the servers are given to listen before any client is started
+START_LEAD = 2.0 # Seconds between launching the clients and their common start, so every interpreter is up in time
+SERVER_STOP_TIMEOUT = 5 # Seconds a server is given to exit after it is interrupted
+CLOCK_WARNING = 0.05 # Seconds a daemon's clock may differ from the coordinator's before --start-at loses its meaning
+
+
+# Backend running the endpoints on the hosts of the PortfolioNetwork2410 topology in Mininet, through each
+# host's popen so every process runs in that host's network namespace
+class MininetBackend:
+    def __init__(self):
+        spec = importlib.util.spec_from_file_location('portfolio_topology', TOPOLOGY)
+        self.topology = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(self.topology)
+        self.net = None
+
+    def start(self, hosts):
+        self.net = self.topology.start_network()
+
+    def address(self, host):
+        return self.net[host].IP()
+
+    def popen(self, host, argv):
+        return self.net[host].popen(argv, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+
+    def stop(self):
+        if self.net:
+            self.net.stop()
+
+
+# Stand-in backend mapping every host to its own loopback address, so a scenario can be run without Mininet
+# or root. h1 becomes 127.0.1.1, h9 127.0.1.9 and r1 127.0.2.1, and every process runs locally
+class LoopbackBackend:
+    def __init__(self):
+        self.addresses = {}
+
+    def start(self, hosts):
+        others = 0
+        for host in sorted(hosts):
+            kind, number = host[:1], host[1:]
+            if number.isdigit() and kind in 'hr':
+                self.addresses[host] = f"127.0.{1 if kind == 'h' else 2}.{int(number)}"
+            else:
+                others += 1
+                self.addresses[host] = f'127.0.3.{others}'
+
+    def address(self, host):
+        return self.addresses[host]
+
+    def popen(self, host, argv):
+        return subprocess.Popen(argv, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+
+    def stop(self):
+        pass
+
+
+# A simpleperf process started by a daemon, with the part of the Popen interface the scenario runner uses
+class RemoteProcess:
+    def __init__(self, connection=None):
+        self.connection = connection
+        self.pid = None
+        self.returncode = None
+        self.output = b''
+        self.exited = threading.Event()
+
+    def finish(self, returncode, output):
+        self.returncode = returncode
+        self.output = output.encode()
+        self.exited.set()
+
+    def poll(self):
+        return self.returncode
+
+    def wait(self, timeout=None):
+        if not self.exited.wait(timeout):
+            raise subprocess.TimeoutExpired(f'simpleperf on {self.connection.address}', timeout)
+        return self.returncode
+
+    def communicate(self):
+        self.wait()
+        return self.output, None
+
+    def send_signal(self, sig):
+        if self.returncode is None:
+            self.connection.request({'op': 'signal', 'pid': self.pid, 'signal': int(sig)})
+
+    def kill(self):
+        self.send_signal(signal.SIGKILL)
+
+# Control connection to one daemon, shared by every endpoint on its host and kept for the whole run. Replies
+# are matched to their requests by id by one reading thread, so requests from many threads can be in flight
+class DaemonConnection:
+    def __init__(self, address):
+        self.address = address
+        self.sock = socket.create_connection(address)
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+        self.replies = {} # Queue of the reply to every request waiting for one
+        self.processes = {} # Process started by every 'start' request, told when it exits
+        self.closed = False
+        threading.Thread(target=self.read, daemon=True).start()
+
+    def request(self, message, process=None):
+        replies = Queue()
+        with self.lock:
+            if self.closed:
+                raise RuntimeError(f'daemon {self.address[0]}:{self.address[1]}: connection closed')
+            message['id'] = next(self.ids)
+            self.replies[message['id']] = replies
+            if process:
+                self.processes[message['id']] = process
+            self.sock.sendall((json.dumps(message) + '\n').encode())
+        reply = replies.get()
+        if not reply.get('ok'):
+            raise RuntimeError(f"daemon {self.address[0]}:{self.address[1]}: {reply.get('error', 'request failed')}")
+        return reply
+
+    def start(self, args):
+        process = RemoteProcess(self)
+        process.pid = self.request({'op': 'start', 'args': args}, process)['pid']
+        return process
+
+    def read(self):
+        try:
+            for line in self.sock.makefile('r', encoding='utf-8'):
+                message = json.loads(line)
+                if message.get('event') == 'exit':
+                    self.processes.pop(message['id']).finish(message['returncode'], message['output'])
+                else:
+                    self.replies.pop(message['id']).put(message)
+        except (OSError, ValueError):
+            pass
+        # The daemon has gone: fail what is waiting instead of leaving it blocked
+        with self.lock:
+            self.closed = True
+        for replies in list(self.replies.values()):
+            replies.put({'ok': False, 'error': 'connection closed'})
+        for process in list(self.processes.values()):
+            process.finish(-1, f'Connection to the daemon at {self.address[0]}:{self.address[1]} closed\n')
+
+    def close(self):
+        self.sock.close()
+
+# Backend running the simpleperf servers and clients through simpleperf daemons (-D), with one pooled control
+# connection per daemon, however many endpoints it runs. A host's address is the one its daemon is bound to.
+# Daemons only run simpleperf, so other commands of a scenario are reported as not run
+class DaemonBackend:
+    def __init__(self, daemons):
+        self.daemons = daemons # Host name to the (address, port) of its daemon
+        self.connections = {}
+        self.addresses = {}
+
+    def start(self, hosts):
+        for host in sorted(hosts):
+            if host not in self.daemons:
+                continue # Only named in a command, which a daemon does not run
+            address = self.daemons[host]
+            if address not in self.connections:
+                self.connections[address] = DaemonConnection(address)
+            sendTime = time.time()
+            hello = self.connections[address].request({'op': 'hello'})
+            offset = hello['time'] - (sendTime + time.time()) / 2
+            if abs(offset) > CLOCK_WARNING:
+                print(f'Warning: the clock of the daemon of {host} is {offset:+.3f} s off, so its --start-at will be too')
+            self.addresses[host] = hello['address']
+
+    def address(self, host):
+        return self.addresses.get(host, host)
+
+    def popen(self, host, argv):
+        if argv[1:2] != [SIMPLEPERF] or host not in self.daemons:
+            process = RemoteProcess()
+            process.finish(1, f'Not run: {host} has no daemon, or the command is not simpleperf: {" ".join(argv)}\n')
+            return process
+        return self.connections[self.daemons[host]].start(argv[2:])
+
+    def stop(self):
+        for connection in self.connections.values():
+            connection.close()
+        self.connections.clear()
+
+BACKENDS = {'mininet': MininetBackend, 'loopback': LoopbackBackend, 'daemon': DaemonBackend}
+
+
+# One process of a scenario: a simpleperf server or client, or any other command such as ping or iperf. Its
+# output is read by a thread of its own while it runs, so no process blocks on a full pipe
+class Endpoint:
+    def __init__(self, kind, spec, index):
+        self.kind = kind
+        self.spec = spec
+        self.host = spec['host']
+        self.start = spec.get('start', 0)
+        self.output = spec.get('output', f"{self.host}-{kind}-{index}.txt")
+        self.process = None
+        self.reader = None
+        self.text = ''
+
+    def launch(self, backend, argv):
+        self.process = backend.popen(self.host, argv)
+        self.reader = threading.Thread(target=self.read, daemon=True)
+        self.reader.start()
+
+    def read(self):
+        self.text = self.process.communicate()[0].decode(errors='replace')
+
+    def wait(self):
+        if self.process:
+            self.process.wait()
+            self.reader.join()
+
+
+# Define a function to replace {host} in a command with that host's address, i.e. ping {h4}
+def resolve(argument, backend, hosts):
+    for host in hosts:
+        argument = argument.replace(f'{{{host}}}', backend.address(host))
+    return argument
+
+# Define a function to find every host a scenario uses, including those only named in a command's arguments
+def scenario_hosts(scenario):
+    hosts = set()
+    for section in ('servers', 'clients', 'commands'):
+        for spec in scenario.get(section, []):
+            hosts.add(spec['host'])
+            if 'server' in spec:
+                hosts.add(spec['server'])
+            for argument in spec.get('cmd', []):
+                hosts.update(part.split('}')[0] for part in argument.split('{')[1:])
+    return hosts
+
+
+# Define a function to run a scenario on a backend and return its endpoints with their outputs. Servers are
+# started first; the clients are then launched together and given one start time on the wall clock with
+# --start-at, plus their own offsets, and other commands are launched by timers at their offsets. Commands
+# marked background, such as iperf -s, are interrupted together with the servers instead of waited for
+def run_scenario(scenario, backend):
+    hosts = scenario_hosts(scenario)
+    backend.start(hosts)
+    servers = [Endpoint('server', spec, i) for i, spec in enumerate(scenario.get('servers', []))]
+    clients = [Endpoint('client', spec, i) for i, spec in enumerate(scenario.get('clients', []))]
+    commands = [Endpoint('command', spec, i) for i, spec in enumerate(scenario.get('commands', []))]
+    python = scenario.get('python', sys.executable)
+
+    try:
+        for server in servers:
+            server.launch(backend, [python, SIMPLEPERF, '-s', '-b', backend.address(server.host),
+                                    '-p', str(server.spec.get('port', DEFAULT_PORT)), *server.spec.get('args', [])])
+        time.sleep(scenario.get('server_warmup', SERVER_WARMUP) if servers else 0)
+
+        startTime = time.time() + scenario.get('start_lead', START_LEAD)
+        for client in clients:
+            client.launch(backend, [python, SIMPLEPERF, '-c', '-I', backend.address(client.spec['server']),
+                                    '-p', str(client.spec.get('port', DEFAULT_PORT)), '--start-at', f'{startTime + client.start:.6f}',
+                                    *client.spec.get('args', [])])
+        timers = []
+        for command in commands:
+            argv = [resolve(argument, backend, hosts) for argument in command.spec['cmd']]
+            timer = threading.Timer(max(0, startTime + command.start - time.time()), command.launch, args=(backend, argv))
+            timer.start()
+            timers.append(timer)
+
+        for timer in timers:
+            timer.join()
+        for endpoint in clients + commands:
+            if not endpoint.spec.get('background'):
+                endpoint.wait()
+    finally:
+        # Servers run until interrupted; they print their last results before they exit
+        stopped = servers + [command for command in commands if command.spec.get('background')]
+        for server in stopped:
+            if server.process and server.process.poll() is None:
+                server.process.send_signal(signal.SIGINT)
+        for server in stopped:
+            if server.process:
+                try:
+                    server.process.wait(SERVER_STOP_TIMEOUT)
+                except subprocess.TimeoutExpired:
+                    server.process.kill()
+                server.wait()
+        backend.stop()
+    return servers + clients + commands
+
+
+# Define a function to merge the totals of every client into one table, with the sum of all of them
+def print_merged(endpoints):
+    print('------------------------------------------------------------')
+    print('Merged results')
+    print('------------------------------------------------------------')
+    total = 0
+    for endpoint in endpoints:
+        if endpoint.kind != 'client':
+            continue
+        result = analysis.parse_lines(endpoint.text.splitlines())
+        throughput = result.tables['throughput']
+        rates = [mbps for flow, mbps, final in zip(throughput['flow'], throughput['mbps'], throughput['final'])
+                 if final and not result.flows[flow].startswith('[SUM]')]
+        total += sum(rates)
+        print(f"{endpoint.host + ' -> ' + endpoint.spec['server']:<16}{len(rates)} stream(s)\t{sum(rates):.2f} Mbps\t{endpoint.output}")
+    print(f"{'Total':<16}\t\t{total:.2f} Mbps")
+
+
+# Define a function to parse a daemon given as HOST=ADDRESS[:PORT]
+def parse_daemon(text):
+    host, _, address = text.partition('=')
+    ip, _, port = address.partition(':')
+    if not host or not ip:
+        raise argparse.ArgumentTypeError(f'{text} is not a daemon such as h1=10.0.0.2 or h1=127.0.0.1:9001')
+    return host, (ip, int(port or DAEMON_PORT))
+
+# Define a function to find a scenario by path, or by name in the scenarios folder
+def load_scenario(name):
+    path = name if os.path.exists(name) else os.path.join(SCENARIOS, name if name.endswith('.json') else name + '.json')
+    with open(path) as file:
+        return json.load(file)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a scenario of concurrent simpleperf servers, clients and commands on Mininet, on loopback or through simpleperf daemons')
+    parser.add_argument('scenario', nargs='?', help='Enter a scenario file, or the name of one in the scenarios folder.')
+    parser.add_argument('--backend', choices=list(BACKENDS), default='mininet', help='Enter where the hosts run (Default - mininet).')
+    parser.add_argument('--daemons', nargs='+', type=parse_daemon, default=[], help=f'Enter the daemon (simpleperf -D) of every host for --backend daemon as HOST=ADDRESS[:PORT] (Default - port {DAEMON_PORT}).')
+    parser.add_argument('-o', '--output', type=str, default=None, help="Enter the folder the endpoints' outputs are written to (Default - print them).")
+    parser.add_argument('--list', action='store_true', help='List the scenarios in the scenarios folder.')
+    args = parser.parse_args()
+
+    if args.list or not args.scenario:
+        for name in sorted(os.listdir(SCENARIOS)):
+            if name.endswith('.json'):
+                print(f"{name[:-5]:<20}{load_scenario(name).get('description', '')}")
+        return
+
+    scenario = load_scenario(args.scenario)
+    backend = DaemonBackend(dict(args.daemons)) if args.backend == 'daemon' else BACKENDS[args.backend]()
+    try:
+        endpoints = run_scenario(scenario, backend)
+    except (OSError, RuntimeError) as e:
+        print(f'Error: {e}')
+        sys.exit(1)
+    if args.output:
+        os.makedirs(args.output, exist_ok=True)
+    for endpoint in endpoints:
+        if args.output:
+            with open(os.path.join(args.output, endpoint.output), 'w') as file:
+                file.write(endpoint.text)
+            print(f'{endpoint.host} {endpoint.kind}: {os.path.join(args.output, endpoint.output)}')
+        else:
+            print('------------------------------------------------------------')
+            print(f'{endpoint.host} {endpoint.kind}: {endpoint.output}')
+            print('------------------------------------------------------------')
+            print(endpoint.text, end='')
+    print_merged(endpoints)
+
+
+if __name__ == '__main__':
+    main()
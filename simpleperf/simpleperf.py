@@ -1,8 +1,52 @@
 import socket
 import argparse
+import asyncio
+import copy
+import fcntl
+import json
+import math
+import multiprocessing
+import os
+import resource
+import selectors
+import signal
+import statistics
+import struct
+import subprocess
 import sys
+import tempfile
 import threading
 import time
+from collections import deque, namedtuple
+from queue import Empty
+
+# Limits and default for the size of the block handed to the socket in each send
+MIN_LENGTH = 1000
+MAX_LENGTH = 16 * 1000**2
+DEFAULT_LENGTH = 128 * 1000
+
+# Default size in bytes of a latency request and its answer
+LATENCY_REQUEST_SIZE = 64
+
+# Default target bitrate of a UDP stream in bits per second, TCP streams are unlimited unless --bitrate is given
+UDP_DEFAULT_BITRATE = 1000**2
+
+# Socket option to cap the kernel's pacing rate of a TCP socket, not exported by every Python version
+SO_MAX_PACING_RATE = getattr(socket, 'SO_MAX_PACING_RATE', 47 if sys.platform.startswith('linux') else None)
+
+# Limits on parallel connections; the threaded client runs one thread per connection, the asyncio client one event loop
+MAX_THREADED_PARALLEL = 5
+MAX_PARALLEL = 1000
+
+# Rolling window of --adaptive: samples of the total rate every ADAPTIVE_PERIOD seconds (or -i), of which the last
+# ADAPTIVE_WINDOW must have a 95% confidence interval within the tolerance. ADAPTIVE_T is Student's t for that window
+ADAPTIVE_PERIOD = 0.5
+ADAPTIVE_WINDOW = 10
+ADAPTIVE_T = 2.262
+
+# Engines available on each side, the first being the default
+SERVER_ENGINES = ['selectors', 'threaded']
+CLIENT_ENGINES = ['threaded', 'asyncio']
 
 # Define a custom action to retrieve ports ∊ [1024, 65535]
 class PortInRangeAction(argparse.Action):
@@ -25,13 +69,20 @@ class LargerThanEqualZeroAction(argparse.Action):
             raise argparse.ArgumentError(self, "Interval entered must be larger than 0.")
         setattr(namespace, self.dest, interval)
 
-# Define a custom action to ensure the amount of parallel connections ∊ [1,5]        
+# Define a custom action to ensure the amount of parallel connections ∊ [1,1000]        
 class ParallelInRangeAction(argparse.Action):
     def __call__(self, parser, namespace, parallel, option_string=None):
-        if parallel < 1 or parallel > 5:
-            raise argparse.ArgumentError(self, f"The amount of parallel connections can only be between 1 and 5.")     
+        if parallel < 1 or parallel > MAX_PARALLEL:
+            raise argparse.ArgumentError(self, f"The amount of parallel connections can only be between 1 and {MAX_PARALLEL}.")     
         setattr(namespace, self.dest, parallel)   
 
+# Define a custom action to ensure the amount of worker processes is at least 1
+class WorkersInRangeAction(argparse.Action):
+    def __call__(self, parser, namespace, workers, option_string=None):
+        if workers < 1:
+            raise argparse.ArgumentError(self, "The amount of workers must be at least 1.")
+        setattr(namespace, self.dest, workers)
+
 # Define a custom action to check for valid total size of data
 class ParseSizeAction(argparse.Action):
     def __call__(self, parser, namespace, num, option_string=None):
@@ -43,6 +94,26 @@ class ParseSizeAction(argparse.Action):
             raise argparse.ArgumentError(self, f'{unit} is an invalid format of unit.')
         setattr(namespace, self.dest, num)
 
+# Define a custom action to check for valid block size ∊ [1 KB, 16 MB], given in bytes or with a unit
+class LengthInRangeAction(argparse.Action):
+    def __call__(self, parser, namespace, length, option_string=None):
+        length_str = length.strip().lower()
+        try:
+            size = int(length_str) if length_str.isdigit() else parse_size(length_str) # Bare numbers are taken as bytes
+        except ValueError:
+            raise argparse.ArgumentError(self, f'{length} is an invalid block size.')
+        if size < MIN_LENGTH or size > MAX_LENGTH:
+            raise argparse.ArgumentError(self, f"{length} is not in range of [1KB, 16MB].")
+        setattr(namespace, self.dest, size)
+
+# Define a custom action to convert a bitrate such as 28M into bits per second
+class ParseRateAction(argparse.Action):
+    def __call__(self, parser, namespace, rate, option_string=None):
+        try:
+            setattr(namespace, self.dest, parse_rate(rate))
+        except ValueError:
+            raise argparse.ArgumentError(self, f'{rate} is an invalid bitrate, use i.e. 500K, 28M or 1G.')
+
 # Define a custom action to check for valid format of unit        
 class ValidFormatAction(argparse.Action):
     def __call__(self, parser, namespace, format, option_string=None):
@@ -65,6 +136,16 @@ def parse_size(size_str):
             raise ValueError('Invalid size unit')
         return int(size) * units[unit]     
 
+# Define a function to convert a bitrate with an optional K, M or G suffix to bits per second
+def parse_rate(rate_str):
+    rate_str = rate_str.strip().upper()
+    units = {'': 1, 'K': 1000, 'M': 1000**2, 'G': 1000**3}
+    rate = rate_str.rstrip('KMG')
+    unit = rate_str[len(rate):]
+    if unit not in units:
+        raise ValueError('Invalid rate unit')
+    return int(float(rate) * units[unit])
+
 # Define a function to convert the result into requested format
 def parse_size_result(size, result_format):
     units = {'b': 1, 'kb': 1000, 'mb': 1000**2}
@@ -74,151 +155,1170 @@ def parse_size_result(size, result_format):
     return totBits / units[result_format.strip().lower()]
 
 
-# Function to handle client and receive packets from client
-def handle_client(conn, addr, args: argparse.Namespace):
-    # Client connected message
-    print(f'Client with {addr} is connected with {args.bind}:{args.port}.')
+# Control protocol between client and server. Before any payload the client sends a fixed-size header
+# describing the test, and when the payload is done it half-closes the connection. The receiver then answers
+# with a stats record, so the end of a test never depends on what the payload contains. With FLAG_REVERSE
+# the server is the sender on the connection, and the client answers with the stats record.
+MAGIC = b'SPRF'
+VERSION = 4
+MODE_TIME, MODE_NUM, MODE_ECHO = 0, 1, 2 # MODE_ECHO: the server writes every byte back, for request/response latency
+MODE_RR = 3 # MODE_RR: the server answers every request of 'length' bytes with 'expected' bytes, for --short-flows
+MODES = {'time': MODE_TIME, 'num': MODE_NUM, 'echo': MODE_ECHO, 'rr': MODE_RR}
+FLAG_ZEROCOPY = 0x1 # Client sends with sendfile, and asks the server to drain with splice
+FLAG_REVERSE = 0x2 # Server sends the payload to the client (-R, and half of the connections with --bidir)
+HEADER = struct.Struct('!4sBBHIQdQ') # magic, version, mode, flags, block size, expected bytes (-n, or response size), duration in seconds (-t), bitrate
+STATS = struct.Struct('!Qd') # bytes received, seconds between header and end of payload
+
+# Test described by a received header
+TestHeader = namedtuple('TestHeader', 'mode flags length expected duration bitrate')
+
+# Define a function to read exactly 'size' bytes, used for the small control records only
+def recv_exact(conn, size):
+    data = bytearray()
+    while len(data) < size:
+        chunk = conn.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError(f'Connection closed after {len(data)} of {size} bytes of a control record')
+        data += chunk
+    return bytes(data)
+
+# Define a function to build the header sent by the client before the payload
+def pack_header(mode, args, reverse=False):
+    flags = (FLAG_ZEROCOPY if args.zerocopy else 0) | (FLAG_REVERSE if reverse else 0)
+    expected = parse_size(args.num) if mode == 'num' else args.response_size if mode == 'rr' else 0
+    duration = args.time if mode != 'num' else 0
+    length = args.request_size if mode in ('echo', 'rr') else args.length
+    return HEADER.pack(MAGIC, VERSION, MODES[mode], flags, length, expected, duration, args.bitrate)
+
+# Define a function to validate a header received by the server
+def unpack_header(header):
+    magic, version, *fields = HEADER.unpack(header)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError('Peer is not a compatible simpleperf client')
+    return TestHeader(*fields)
+
+
+# Queue to the parent process when running as one of several server workers (--workers), otherwise None
+workerQueue = None
 
-    # Supporting variables
-    startInterval = endTime = data = 0
-    startTime = time.time() # Keep count of when the task has begun, if not already started. Also calls a function that counts.
+# Define a function to print the result of one client in the server's report format
+def print_server_result(addr, data, elapsedTime, args, sent=False, calls=0, cpu=None):
+    # A server worker hands its counters to the parent, which prints the combined report
+    if workerQueue is not None:
+        workerQueue.put(('result', addr, data, elapsedTime, sent, calls, cpu))
+        return
     
-    try:
-        # Receive packets from client
-        while True: 
-            chunk = conn.recv(1000)
-            data += len(chunk) # Total data is stored in supporting variable
-            # If an error occurs on client-side, server is informed and cancels further operations
-            if chunk.decode().strip()[-3:] == 'BYE': # If chunks are no longer received or client sends "BYE"-message as the last three letters from a packet
-                endTime = time.time() # Record time when finished and stops counting function
-                conn.sendall("ACK: BYE".encode()) # Server informs the client that all packets are received
-                break
-            
-    except Exception as e:
-        print(f'Error communicating with {addr}: {e}')
+    cpuFields = {'user_seconds': cpu[0], 'system_seconds': cpu[1]} if cpu else {}
+    if args.json:
+        print(format_row(f'{addr[0]}:{addr[1]}', 0, elapsedTime, data, args, kind='summary', direction='sent' if sent else 'received', calls=calls, **cpuFields), flush=True)
+        return
     
-    # Process data to be used in result(s)
-    elapsedTime = endTime - startTime # Duration data was sent in seconds
+    startInterval = 0
     endInterval = elapsedTime
     
     dataSize = parse_size_result((data), args.format) # Parsing data from Bytes to bits, total size of data received in requested format
-    bandwidth = (parse_size_result(data, 'MB')*8) / elapsedTime # Parsing data from MB to Mb, calculating rate in mbps
+    bandwidth = (parse_size_result(data, 'MB')*8) / elapsedTime if elapsedTime else 0 # Parsing data from MB to Mb, calculating rate in mbps
 
+    # Data the server sent on a reverse connection is marked as its transmit direction
+    if sent:
+        addr = f'[TX] {addr}'
+    # With --cpu, the calls that moved the data and the server's CPU time during the test
+    efficiency = ''
+    if args.cpu:
+        efficiency = f"\t{calls} calls\t{data / calls if calls else 0:.0f} B/call"
+        if cpu:
+            efficiency += f"\tuser {cpu[0]:.2f} s\tsys {cpu[1]:.2f} s"
     # Print result(s) 
     print('ID\t\tInterval\tTransfer\tBandwidth')
     if args.format.lower() == 'mb': # Print out total number of bytes received with two decimals if requested format is in 'MB'
-        print(f"{addr}\t\t{startInterval:.1f} - {endInterval:.1f}\t{dataSize:.2f} {args.format}\t{bandwidth:.2f} Mbps")
+        print(f"{addr}\t\t{startInterval:.1f} - {endInterval:.1f}\t{dataSize:.2f} {args.format}\t{bandwidth:.2f} Mbps{efficiency}")
     else: # Print out total bytes as a whole number if requested format is a smaller form than 'MB'
-        print(f"{addr}\t\t{startInterval:.1f} - {endInterval:.1f}\t{int(dataSize)} {args.format}\t{bandwidth:.2f} Mbps")
+        print(f"{addr}\t\t{startInterval:.1f} - {endInterval:.1f}\t{int(dataSize)} {args.format}\t{bandwidth:.2f} Mbps{efficiency}")
+
+
+# Define a function to print the message when a client connects
+def print_connected(addr, args):
+    if workerQueue is not None:
+        workerQueue.put(('connected', addr))
+        return
+    print_text(args, f'Client with {addr} is connected with {args.bind}:{args.port}.')
+
+
+# File descriptor of /dev/null that spliced payload is drained into, opened once on first use
+devnullFd = None
+
+def devnull():
+    global devnullFd
+    if devnullFd is None:
+        devnullFd = os.open(os.devnull, os.O_WRONLY)
+    return devnullFd
+
+# Define a function to create the pipe a session splices through, grown towards the block size so one splice
+# can move a whole block
+def open_splice_pipe(length):
+    pipe = os.pipe()
+    try:
+        fcntl.fcntl(pipe[1], fcntl.F_SETPIPE_SZ, length)
+    except OSError:
+        pass # Larger than /proc/sys/fs/pipe-max-size allows, keep the default size
+    return pipe
+
+
+# Receiving side of one client connection. The same state machine is driven by a thread per client on a
+# blocking socket (handle_client) or by the shared event loop on a non-blocking socket (serve_selectors),
+# so both server engines report identically. Only the counters live here; the receive buffer is passed in.
+# On a reverse connection the session only reads the header, and send_reverse then sends from a thread
+class ReceiveSession:
+    BURST = 64 # Most reads per readiness event, so one busy client cannot starve the others in the event loop
+
+    def __init__(self, conn, addr, args, buffer):
+        self.conn = conn
+        self.addr = addr
+        self.args = args
+        self.buffer = buffer
+        self.header = bytearray()
+        self.test = None # Unknown until the header has been received
+        self.pipe = None # Pipe the payload is spliced through when the client sends with -Z
+        self.data = 0
+        self.calls = 0 # Receive calls made, so benchmarks can count system calls per byte
+        self.startTime = self.endTime = 0
+        self.startCpu = None # CPU time of the server process when the test began, with --cpu
+        self.pending = 0 # Bytes of the request not answered yet, with MODE_RR
+        self.done = False
+
+    def on_readable(self):
+        try:
+            if self.test is None:
+                # Collect the header, which may arrive in pieces on a non-blocking socket
+                chunk = self.conn.recv(HEADER.size - len(self.header))
+                if not chunk:
+                    raise ConnectionError('Connection closed before the header was received')
+                self.header += chunk
+                if len(self.header) < HEADER.size:
+                    return
+                self.test = unpack_header(bytes(self.header))
+                # Client connected message. Short flows open a connection per transaction, so they are not announced
+                if self.test.mode != MODE_RR:
+                    print_connected(self.addr, self.args)
+                if self.test.flags & FLAG_REVERSE:
+                    self.done = True # Nothing more to read until the client's stats record, see send_reverse
+                    return
+                if self.test.flags & FLAG_ZEROCOPY and hasattr(os, 'splice'):
+                    self.pipe = open_splice_pipe(self.args.length)
+                if self.test.mode in (MODE_ECHO, MODE_RR):
+                    self.conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1) # Answer every request at once
+                if self.test.mode == MODE_RR:
+                    self.response = bytes(self.test.expected)
+                self.startTime = time.time() # Keep count of when the task has begun, once the header has been received
+                self.startCpu = process_cpu() if self.args.cpu else None
+
+            # Receive payload until the client half-closes, or until the announced amount of bytes has arrived with -n.
+            # The payload itself is never inspected, only counted
+            for _ in range(self.BURST):
+                received = self.splice() if self.pipe else self.conn.recv_into(self.buffer)
+                self.calls += 1
+                if not received: # Client has sent all its data
+                    self.finish()
+                    return
+                self.data += received # Total data is stored in supporting variable
+                if self.test.mode == MODE_ECHO:
+                    self.send_back(memoryview(self.buffer)[:received])
+                elif self.test.mode == MODE_RR:
+                    self.respond(received)
+                elif self.test.mode == MODE_NUM and self.data >= self.test.expected:
+                    self.finish()
+                    return
+        except BlockingIOError:
+            return # Nothing more to read until the event loop reports the socket readable again
+        except Exception as e:
+            print_error(self.args, f'Error communicating with {self.addr}: {e}')
+            self.done = True
+
+    # Write an answer to the client. A latency client waits for each answer before sending its next request,
+    # so the answer nearly always fits in the socket buffer at once; otherwise the rest is written blocking,
+    # briefly holding up the event loop
+    def send_back(self, view):
+        sent = self.conn.send(view)
+        if sent < len(view):
+            blocking = self.conn.getblocking()
+            self.conn.setblocking(True)
+            self.conn.sendall(view[sent:])
+            self.conn.setblocking(blocking)
+
+    # Answer every complete request of the header's length with a response of the size it asked for
+    def respond(self, received):
+        self.pending += received
+        while self.pending >= self.test.length:
+            self.pending -= self.test.length
+            self.send_back(self.response)
+
+    # Move payload from the socket to /dev/null through a pipe without copying it into Python
+    def splice(self):
+        received = os.splice(self.conn.fileno(), self.pipe[1], self.args.length, flags=os.SPLICE_F_MOVE)
+        drained = 0
+        while drained < received:
+            drained += os.splice(self.pipe[0], devnull(), received - drained, flags=os.SPLICE_F_MOVE)
+        return received
+
+    def finish(self):
+        self.endTime = time.time() # Record time when finished
+        self.done = True
+        if self.test.mode == MODE_RR:
+            return # A short-flow client closes without waiting for a stats record, and reports the transactions itself
+        # Server informs the client of how much was received and over how long. The record is tiny and the
+        # client has read everything written before it, so a blocking sendall returns at once
+        self.conn.setblocking(True)
+        self.conn.sendall(STATS.pack(self.data, self.endTime - self.startTime))
+        print_server_result(self.addr, self.data, self.endTime - self.startTime, self.args, calls=self.calls, cpu=self.cpu_used())
+
+    # The server process's CPU time while the test ran, shared with any tests running at the same time
+    def cpu_used(self):
+        if self.startCpu is None:
+            return None
+        user, system = process_cpu()
+        return user - self.startCpu[0], system - self.startCpu[1]
+
+    @property
+    def reverse(self):
+        return self.test is not None and bool(self.test.flags & FLAG_REVERSE)
+
+    # Send the payload the client asked for on a reverse connection with the client's send loop, then
+    # half-close and wait for the client's stats record. Blocking, so run from the session's own thread
+    def send_reverse(self):
+        self.conn.setblocking(True)
+        testArgs = argparse.Namespace(**vars(self.args))
+        testArgs.length = self.test.length
+        testArgs.time = self.test.duration
+        testArgs.bitrate = self.test.bitrate
+        testArgs.zerocopy = bool(self.test.flags & FLAG_ZEROCOPY)
+        testArgs.file = None # The server sends from a memfd
+        stream = Stream(self.conn)
+        
+        self.startTime = time.time()
+        self.startCpu = process_cpu() if self.args.cpu else None
+        try:
+            send_payload(stream, testArgs, 'num' if self.test.mode == MODE_NUM else 'time', self.test.expected)
+            self.conn.shutdown(socket.SHUT_WR)
+            recv_exact(self.conn, STATS.size)
+        except (socket.error, ConnectionError) as e:
+            print_error(self.args, f'Error communicating with {self.addr}: {e}')
+        self.endTime = time.time()
+        print_server_result(self.addr, stream.data, self.endTime - self.startTime, self.args, sent=True, calls=stream.calls, cpu=self.cpu_used())
+
+    def send_reverse_and_close(self):
+        self.send_reverse()
+        self.close()
+
+    def close(self):
+        self.conn.close()
+        if self.pipe:
+            os.close(self.pipe[0])
+            os.close(self.pipe[1])
+
+
+# Function to handle client and receive packets from client in its own thread
+def handle_client(conn, addr, args: argparse.Namespace):
+    session = ReceiveSession(conn, addr, args, bytearray(args.length)) # Preallocated receive buffer of size -l/--length
+    while not session.done:
+        session.on_readable()
+    if session.reverse:
+        session.send_reverse()
     # Closes client connection when finished
-    conn.close()
+    session.close()
+
+
+# Function to serve every client from a single thread, multiplexing all sockets with selectors (epoll on Linux)
+def serve_selectors(serverSocket, args: argparse.Namespace):
+    buffer = bytearray(args.length) # One receive buffer shared by all clients, since only one is read at a time
+    selector = selectors.DefaultSelector()
+    serverSocket.setblocking(False)
+    selector.register(serverSocket, selectors.EVENT_READ)
+    
+    while True:
+        for key, events in selector.select():
+            if key.data is None:
+                # Accept every pending client on the listening socket
+                while True:
+                    try:
+                        clientSocket, clientAddress = serverSocket.accept()
+                    except BlockingIOError:
+                        break
+                    clientSocket.setblocking(False)
+                    selector.register(clientSocket, selectors.EVENT_READ, ReceiveSession(clientSocket, clientAddress, args, buffer))
+            else:
+                session = key.data
+                session.on_readable()
+                if session.done:
+                    selector.unregister(key.fileobj)
+                    if session.reverse:
+                        # Sending is left to a thread with the blocking send loop, so the event loop only ever receives
+                        threading.Thread(target=session.send_reverse_and_close, daemon=True).start()
+                    else:
+                        session.close()
+
+
+# Define a function to create the listening socket. Server workers each bind their own socket to the same
+# port with SO_REUSEPORT, and the kernel spreads incoming connections across them
+def listen_server(args: argparse.Namespace):
+    serverSocket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    serverSocket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1) # Allow restarting the server while old connections are in TIME_WAIT
+    if args.workers > 1:
+        serverSocket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    # Bind hostname and port and queue up to -B/--backlog pending clients
+    serverSocket.bind((args.bind, args.port))
+    serverSocket.listen(args.backlog)
+    return serverSocket
+
+
+# Function to accept clients with the chosen engine until the server is stopped
+def serve_clients(serverSocket, args: argparse.Namespace):
+    if args.engine == 'selectors':
+        serve_selectors(serverSocket, args)
+    
+    while True: # Mangler å gå ut av løkke når det ikke er flere clienter som kobles til 
+        # Accepting clients and creating threads for parallel connections
+        clientSocket, clientAddress = serverSocket.accept()
         
+        # Handling each thread with corresponding arguments
+        t = threading.Thread(target=handle_client, args=(clientSocket, clientAddress, args))
+        t.start()
+
+
+# Function run in each server worker process, reporting to the parent through the queue
+def server_worker(args: argparse.Namespace, queue):
+    global workerQueue
+    workerQueue = queue
+    try:
+        with listen_server(args) as serverSocket:
+            serve_clients(serverSocket, args)
+    except KeyboardInterrupt:
+        pass
+    except Exception as e:
+        print_error(args, f'Server worker {args.bind}:{args.port}: {e}')
+
+
+# Function to fork the server workers and print their clients' results as one report
+def run_server_workers(args: argparse.Namespace):
+    context = multiprocessing.get_context('fork')
+    queue = context.Queue()
+    workers = [context.Process(target=server_worker, args=(args, queue), daemon=True) for _ in range(args.workers)]
+    for worker in workers:
+        worker.start()
     
+    try:
+        while any(worker.is_alive() for worker in workers):
+            try:
+                message = queue.get(timeout=0.5)
+            except Empty:
+                continue
+            if message[0] == 'connected':
+                print_text(args, f'Client with {message[1]} is connected with {args.bind}:{args.port}.')
+            else:
+                addr, data, elapsedTime, sent, calls, cpu = message[1:]
+                print_server_result(addr, data, elapsedTime, args, sent, calls, cpu)
+    except KeyboardInterrupt:
+        print_text(args, 'Closing server')
+        for worker in workers:
+            worker.terminate()
+        sys.exit(1)
+
+
 def start_server(args: argparse.Namespace):
     
     # Prepare a server socket and bind IP and Port.
     serverHost = args.bind
     serverPort = args.port
     
-    
-    # Bind hostname and port to listen to maximum 5 clients
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as serverSocket:
-        serverSocket.bind((serverHost,serverPort))
-        serverSocket.listen(5)
-        print('------------------------------------------------')
-        print(f'A simpleperf server is listening on port {serverPort}')
-        print('------------------------------------------------')
-    
+    try:
+        if args.udp:
+            start_udp_server(args)
+            return
         
-        try: 
-            while True: # Mangler å gå ut av løkke når det ikke er flere clienter som kobles til 
-                try:
-                    # Accepting clients and creating threads for parallel connections
-                    clientSocket, clientAddress = serverSocket.accept()
-                
-                except KeyboardInterrupt:
-                    print('Closing server')
-                    sys.exit(1)
-                
-                # Handling each thread with corresponding arguments
-                t = threading.Thread(target=handle_client, args=(clientSocket, clientAddress, args))
-                t.start()
-                
-        except Exception as e:
-            print(f'Server {serverHost}:{serverPort}: {e}') # Reports issues when binding server or when server closes
+        if args.workers > 1:
+            print_text(args, '------------------------------------------------')
+            print_text(args, f'A simpleperf server is listening on port {serverPort} with {args.workers} workers')
+            print_text(args, '------------------------------------------------')
+            run_server_workers(args)
+            return
+        
+        with listen_server(args) as serverSocket:
+            print_text(args, '------------------------------------------------')
+            print_text(args, f'A simpleperf server is listening on port {serverPort}')
+            print_text(args, '------------------------------------------------')
+            serve_clients(serverSocket, args)
         
-        # Closing server bind when all threads are finished
-        serverSocket.close() 
+    except KeyboardInterrupt:
+        print_text(args, 'Closing server')
+        sys.exit(1)
+            
+    except Exception as e:
+        print_error(args, f'Server {serverHost}:{serverPort}: {e}') # Reports issues when binding server or when server closes
+
+# Daemon mode (-D). A resident process takes requests as JSON lines on a control port and runs each test as a
+# simpleperf process of its own, so a coordinator can start servers and clients on many hosts for one moment
+# with --start-at. Every request carries an id that its reply repeats; a started process is answered once at
+# the start with its pid and once more when it exits, with its output. Processes still running when their
+# control connection closes are interrupted
+DAEMON_PORT = 8089
+# Options a coordinator may give in a request. Every argument starting with '-' must be one of them as written,
+# so an abbreviation, an '=' or a group of short options cannot slip in -D (a daemon starting another) or
+# -F (sending any file the daemon can read to any host)
+DAEMON_OPTIONS = frozenset((
+    '-s', '--server', '-c', '--client', '-b', '--bind', '-I', '--serverip', '-p', '--port', '-B', '--backlog',
+    '-l', '--length', '-e', '--engine', '-w', '--workers', '-u', '--udp', '-J', '--json', '-C', '--cpu', '-f', '--format',
+    '-i', '--interval', '-P', '--parallel', '--bitrate', '-L', '--latency', '--load', '--request-size', '--short-flows',
+    '--response-size', '-O', '--omit', '--adaptive', '--start-at', '-Z', '--zerocopy', '-R', '--reverse', '--bidir',
+    '-n', '--num', '-t', '--time',
+))
+
+# One control connection of the daemon and the processes started through it
+class DaemonSession:
+    def __init__(self, conn, addr, args):
+        self.conn = conn
+        self.addr = addr
+        self.args = args
+        self.lock = threading.Lock() # Replies come from the reading thread and from one thread per process
+        self.processes = {}
+
+    def reply(self, message):
+        with self.lock:
+            self.conn.sendall((json.dumps(message) + '\n').encode())
+
+    def run(self):
+        try:
+            for line in self.conn.makefile('r', encoding='utf-8'):
+                request = None
+                try:
+                    request = json.loads(line)
+                    self.handle(request)
+                except (ValueError, TypeError, KeyError, AttributeError, OSError) as e:
+                    self.reply({'id': request.get('id') if isinstance(request, dict) else None, 'ok': False, 'error': str(e)})
+        except (OSError, ValueError):
+            pass # Connection reset, or closed while a reply was sent
+        for process in list(self.processes.values()):
+            process.send_signal(signal.SIGINT)
+        self.conn.close()
+
+    def handle(self, request):
+        requestId, op = request.get('id'), request.get('op')
+        if op == 'hello':
+            self.reply({'id': requestId, 'ok': True, 'version': VERSION, 'address': self.args.bind, 'time': time.time()})
+        elif op == 'start':
+            argv = request['args']
+            if not isinstance(argv, list) or not all(isinstance(argument, str) for argument in argv):
+                raise ValueError('args must be a list of simpleperf options')
+            refused = [argument for argument in argv if argument.startswith('-') and argument not in DAEMON_OPTIONS]
+            if refused:
+                raise ValueError(f"options not accepted by a daemon: {' '.join(refused)}; give each option whole and on its own, -D and -F are never accepted")
+            process = subprocess.Popen([sys.executable, os.path.abspath(__file__), *argv], stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+            self.processes[process.pid] = process
+            self.reply({'id': requestId, 'ok': True, 'pid': process.pid})
+            threading.Thread(target=self.watch, args=(requestId, process), daemon=True).start()
+        elif op == 'signal':
+            process = self.processes.get(request['pid'])
+            if process:
+                process.send_signal(int(request['signal']))
+            self.reply({'id': requestId, 'ok': process is not None})
+        else:
+            raise ValueError(f'unknown op {op}')
+
+    # Answer the request that started a process once it exits, with everything it printed
+    def watch(self, requestId, process):
+        output = process.communicate()[0]
+        self.processes.pop(process.pid, None)
+        try:
+            self.reply({'id': requestId, 'event': 'exit', 'pid': process.pid, 'returncode': process.returncode, 'output': output.decode(errors='replace')})
+        except OSError:
+            pass # The coordinator has gone
+
+# Function to run the daemon until interrupted, with one thread per control connection
+def run_daemon(args: argparse.Namespace):
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as controlSocket:
+        controlSocket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            controlSocket.bind((args.bind, args.daemon))
+        except OSError as e:
+            print(f'Daemon {args.bind}:{args.daemon}: {e}')
+            sys.exit(1)
+        controlSocket.listen()
+        print('------------------------------------------------')
+        print(f'A simpleperf daemon is listening on {args.bind}, control port {args.daemon}')
+        print('------------------------------------------------', flush=True)
+        try:
+            while True:
+                conn, addr = controlSocket.accept()
+                print(f'Coordinator {addr[0]}:{addr[1]} connected', flush=True)
+                threading.Thread(target=DaemonSession(conn, addr, args).run, daemon=True).start()
+        except KeyboardInterrupt:
+            print('Closing daemon')
 
 # Initialize supporting variables 
 outResult = [] # Results to be saved until all tasks are complete and all threads have closed
 
-def send_data(clientSocket, args, mode, endTime):
-    dataPacket = '0' * 1000 # Format the packets of data in a size of 1000 bits
-    dataSent = 0 # Supporting variable which will help keep count of the amount packets sent in total
-    startInterval  = 0 # Supporting variable to display start-interval
-    global outResult # Store multiple items in global variable in case of multiple threads calling function "send_data()"
+# Define a function to format one row of the client's report, with the bandwidth of the interval in Mbps
+def format_row(name, startInterval, endInterval, data, args, kind='interval', sock=None, target=0, calls=None, shortWrites=None, **extra):
+    duration = endInterval - startInterval
+    if target:
+        extra['target_bits_per_second'] = target
+    if calls is not None:
+        extra['calls'] = calls
+    if shortWrites is not None:
+        extra['short_writes'] = shortWrites
+    # With --json every row is one NDJSON record instead, with the kernel's TCP_INFO of the stream's socket
+    if args.json:
+        record = {'type': kind, 'stream': name.strip(), 'start': round(startInterval, 6), 'end': round(endInterval, 6), 'bytes': data,
+                  'bits_per_second': data * 8 / duration if duration > 0 else 0, **extra}
+        if sock is not None:
+            record['tcp_info'] = read_tcp_info(sock)
+        return json.dumps(record)
+    dataSize = parse_size_result(data, args.format)
+    bandwidth = (parse_size_result(data, 'MB')*8) / duration if duration > 0 else 0
+    digits = interval_digits(args.interval) # Enough decimals to tell sub-second intervals apart
+    # With a target bitrate, the achieved rate is shown against the requested one
+    achieved = f"\t{bandwidth * 1000**2 / target * 100:.1f}% of {target / 1000**2:.2f} Mbps" if target else ''
+    # With --cpu, how many send or receive calls moved the data, and how many sends took less than they were given
+    if args.cpu and calls is not None:
+        achieved += f"\t{calls} calls\t{data / calls if calls else 0:.0f} B/call"
+        if shortWrites is not None:
+            achieved += f"\t{shortWrites} short"
+    if args.format.lower() == 'mb': # Print out total number of bytes with two decimals if requested format is in 'MB'
+        return f"{name}\t{startInterval:.{digits}f} - {endInterval:.{digits}f}\t{dataSize:.2f} {args.format}\t{bandwidth:.2f} Mbps{achieved}"
+    # Print out total bytes as a whole number if requested format is a smaller form than 'MB'
+    return f"{name}\t{startInterval:.{digits}f} - {endInterval:.{digits}f}\t{int(dataSize)} {args.format}\t{bandwidth:.2f} Mbps{achieved}"
+
+# Layout of struct tcp_info in linux/tcp.h up to tcpi_delivery_rate: 8 single-byte fields, 24 u32 (tcpi_rto to
+# tcpi_total_retrans), 4 u64 (tcpi_pacing_rate to tcpi_bytes_received), 6 u32 (tcpi_segs_out to
+# tcpi_data_segs_out) and u64 tcpi_delivery_rate. Older kernels return fewer bytes, the rest reads as 0
+TCP_INFO = struct.Struct('=8B24I4Q6IQ')
+TCP_INFO_FIELDS = {'rtt_us': 23, 'rttvar_us': 24, 'min_rtt_us': 39, 'snd_cwnd': 26, 'snd_mss': 10, 'retransmits': 31, 'lost': 14,
+                   'pacing_rate': 32, 'delivery_rate': 42} # Name in the JSON record and index in TCP_INFO; rates in bytes per second
+
+# Define a function to read the kernel's TCP state of a socket, or None where TCP_INFO is not available
+def read_tcp_info(sock):
+    if not hasattr(socket, 'TCP_INFO'):
+        return None
+    try:
+        raw = sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_INFO, TCP_INFO.size)
+    except OSError: # Closed, or not a TCP socket
+        return None
+    values = TCP_INFO.unpack(raw.ljust(TCP_INFO.size, b'\0'))
+    return {field: values[index] for field, index in TCP_INFO_FIELDS.items()}
+
+# Define a function to print a line that only belongs in the text report, such as titles and separators
+def print_text(args, line):
+    if not args.json:
+        print(line)
+
+# Define a function to report an error, as an NDJSON record with --json so the output stays one record per line
+def print_error(args, message):
+    if args.json:
+        print(json.dumps({'type': 'error', 'message': message}), flush=True)
+    else:
+        print(message)
+
+# Define a function to return the user and system CPU seconds used so far by this process and its finished
+# children, and by the running worker processes in 'pids' as /proc reports them where it exists
+def process_cpu(pids=()):
+    user = system = 0.0
+    for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN):
+        usage = resource.getrusage(who)
+        user += usage.ru_utime
+        system += usage.ru_stime
+    for pid in pids:
+        try:
+            with open(f'/proc/{pid}/stat') as stat:
+                fields = stat.read().rsplit(')', 1)[1].split() # The name in parentheses may contain spaces
+        except OSError:
+            continue # Exited and reaped, so counted in RUSAGE_CHILDREN
+        user += int(fields[11]) / CLOCK_TICKS
+        system += int(fields[12]) / CLOCK_TICKS
+    return user, system
+
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+
+# Define a function to format the CPU time used during an interval, as a share of one core
+def format_cpu_row(startInterval, endInterval, user, system, args, kind='cpu_interval'):
+    duration = endInterval - startInterval
+    utilization = 100 * (user + system) / duration if duration > 0 else 0
+    if args.json:
+        return json.dumps({'type': kind, 'start': round(startInterval, 6), 'end': round(endInterval, 6), 'user_seconds': user, 'system_seconds': system,
+                           'cpu_percent': utilization})
+    digits = interval_digits(args.interval)
+    return f"[CPU]\t\t{startInterval:.{digits}f} - {endInterval:.{digits}f}\tuser {user:.2f} s\tsys {system:.2f} s\t{utilization:.0f}% of a core"
+
+# Define a function to find how many decimals an interval needs, one for whole and tenth seconds
+def interval_digits(interval):
+    digits = 1
+    while interval and round(interval, digits) != interval and digits < 3:
+        digits += 1
+    return digits
+
+
+# Prints the interval results of every stream, and a [SUM] row across them, from one thread. The boundaries are
+# fixed to the start on the monotonic clock so they do not drift, and each rate is computed from the bytes
+# counted between two snapshots over the time between them. The counters are read without locks, as each is
+# only written by the sender of its own stream. On stop, a final [SUM] row is added to the results. With --cpu
+# the calls of every stream and the CPU time of the process are sampled the same way, from counters only. With
+# --omit the counters are taken again when the warm-up ends and the totals start from there, and with
+# --adaptive every sample feeds a rolling window, which ends the test once its estimate is tight enough
+class IntervalReporter:
+    def __init__(self, names, snapshot, args, startTime=None, sockets=None, directions=None, calls=None, cpu=process_cpu):
+        self.names = names
+        self.snapshot = snapshot # Returns the bytes sent so far by every stream
+        self.sockets = sockets or [None] * len(names) # Sampled for TCP_INFO with --json
+        self.directions = directions or [''] * len(names) # Streams of each direction are summed separately
+        self.calls = calls # Returns the calls and short writes so far of every stream, for --cpu
+        self.cpu = cpu # Returns the user and system CPU seconds used so far
+        self.args = args
+        self.startTime = time.monotonic() if startTime is None else startTime
+        self.startCpu = cpu() if args.cpu else None
+        self.omitted = None # Counters at the end of --omit
+        self.window = deque(maxlen=ADAPTIVE_WINDOW) # Latest rates in bytes per second, for --adaptive
+        self.stopped = threading.Event()
+        self.thread = None
+        if args.interval or args.adaptive:
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+        self.omitTimer = None
+        if args.omit:
+            self.omitTimer = threading.Timer(max(0, self.startTime + args.omit - time.monotonic()), self.omit)
+            self.omitTimer.daemon = True
+            self.omitTimer.start()
+
+    @classmethod
+    def for_streams(cls, streams, args):
+        return cls([stream.name for stream in streams], lambda: [stream.data for stream in streams], args,
+                   sockets=[stream.sock for stream in streams], directions=[stream.direction for stream in streams],
+                   calls=lambda: [(stream.calls, stream.shortWrites) for stream in streams])
+
+    # Define a function to take one snapshot of every counter: bytes, and with --cpu calls and CPU time
+    def sample(self):
+        if not self.args.cpu:
+            return self.snapshot(), None, None
+        return self.snapshot(), self.calls() if self.calls else None, self.cpu()
+
+    def omit(self):
+        self.omitted = self.sample()
+
+    def run(self):
+        period = self.args.interval or ADAPTIVE_PERIOD
+        last = ([0] * len(self.names), [(0, 0)] * len(self.names), self.startCpu)
+        lastTime = self.startTime
+        count = 0
+        while True:
+            count += 1
+            stopped = self.stopped.wait(max(0, self.startTime + count * period - time.monotonic()))
+            now = time.monotonic()
+            current = self.sample()
+            # A remainder shorter than a tenth of an interval when the test ends is left to the total
+            if self.args.interval and (not stopped or now - lastTime >= self.args.interval / 10):
+                # Whether the interval is part of the warm-up follows its scheduled end, as the wake-up comes a little late
+                self.print_interval(lastTime - self.startTime, now - self.startTime, current, last, omitted=count * period <= self.args.omit + 1e-9)
+            if stopped:
+                return
+            if self.args.adaptive and self.converged(lastTime - self.startTime, now - self.startTime, sum(current[0]) - sum(last[0])):
+                self.args.stopFlag.value = 1 # The senders see it in their loops and end the test
+            last, lastTime = current, now
+
+    def print_interval(self, startInterval, endInterval, current, last, omitted=False):
+        sent = [now - before for now, before in zip(current[0], last[0])]
+        calls = [(now[0] - before[0], now[1] - before[1]) for now, before in zip(current[1], last[1])] if current[1] else [(None, None)] * len(sent)
+        # Intervals of the --omit warm-up are reported, but marked as left out of the totals
+        extra = {'omitted': True} if omitted else {}
+        mark = '\t(omitted)' if omitted and not self.args.json else ''
+        for name, data, sock, (callCount, shortWrites) in zip(self.names, sent, self.sockets, calls):
+            print(format_row(name, startInterval, endInterval, data, self.args, sock=sock, target=self.args.bitrate, calls=callCount, shortWrites=shortWrites, **extra) + mark, flush=True)
+        for name, data, count in self.sums(sent):
+            print(format_row(name, startInterval, endInterval, data, self.args, kind='interval_sum', target=self.args.bitrate * count, **extra) + mark, flush=True)
+        if current[2]:
+            print(format_cpu_row(startInterval, endInterval, current[2][0] - last[2][0], current[2][1] - last[2][1], self.args) + mark, flush=True)
+
+    # Define a function to add the total rate of one sample after the warm-up to the window of --adaptive, and
+    # tell whether the 95% confidence interval of the window's mean is within the tolerance of it
+    def converged(self, startInterval, endInterval, data):
+        if startInterval < self.args.omit or endInterval <= startInterval:
+            return False
+        self.window.append(data / (endInterval - startInterval))
+        if len(self.window) < ADAPTIVE_WINDOW:
+            return False
+        mean = statistics.fmean(self.window)
+        halfWidth = ADAPTIVE_T * statistics.stdev(self.window) / math.sqrt(len(self.window))
+        if not mean or halfWidth > self.args.adaptive * mean:
+            return False
+        if self.args.json:
+            print(json.dumps({'type': 'converged', 'end': round(endInterval, 6), 'bits_per_second': mean * 8, 'confidence_bits_per_second': halfWidth * 8}), flush=True)
+        else:
+            print(f'Converged after {endInterval:.1f} s: {mean * 8 / 1000**2:.2f} Mbps \u00b1 {halfWidth * 8 / 1000**2:.2f} Mbps at 95% confidence', flush=True)
+        return True
+
+    # Yield a [SUM] row's name, bytes and stream count for every direction with more than one stream, sending first
+    def sums(self, sent):
+        for direction in sorted(set(self.directions), reverse=True):
+            members = [data for data, streamDirection in zip(sent, self.directions) if streamDirection == direction]
+            if len(members) > 1:
+                yield f'[SUM][{direction}]\t' if direction else '[SUM]\t', sum(members), len(members)
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread:
+            self.thread.join()
+        if self.omitTimer:
+            self.omitTimer.cancel()
+        elapsedTime = time.monotonic() - self.startTime
+        # The totals start at the end of --omit, or at the start when the test ended before it
+        startInterval, (omittedData, _, omittedCpu) = (self.args.omit, self.omitted) if self.omitted else (0, ([0] * len(self.names), None, self.startCpu))
+        sent = [now - before for now, before in zip(self.snapshot(), omittedData)]
+        for name, data, count in self.sums(sent):
+            outResult.append(format_row(name, startInterval, elapsedTime, data, self.args, kind='summary_sum', target=self.args.bitrate * count))
+        if self.args.cpu:
+            user, system = self.cpu()
+            outResult.append(format_cpu_row(startInterval, elapsedTime, user - omittedCpu[0], system - omittedCpu[1], self.args, kind='cpu_summary'))
+
+
+# One parallel stream of the client, holding its socket and the bytes written so far
+class Stream:
+    def __init__(self, sock, direction=''):
+        self.sock = sock
+        self.direction = direction # 'TX' or 'RX' with -R or --bidir, so each direction is reported on its own
+        clientIp, clientPort = sock.getsockname()
+        self.name = f'[{direction}] {clientIp}:{clientPort}' if direction else f'{clientIp}:{clientPort}'
+        self.data = 0 # Bytes sent, or received on a reverse stream
+        self.calls = 0 # Send or receive calls made on the stream
+        self.shortWrites = 0 # Sends the kernel took only part of
+        self.omitted = (0, 0, 0) # Counters at the end of --omit, left out of the summary
+        self.omitEnd = 0
+
+    def omit(self, at):
+        self.omitted = (self.data, self.calls, self.shortWrites)
+        self.omitEnd = at
+
+    # Define a function to format the summary row of the stream, from the end of --omit to 'elapsedTime'
+    def summary(self, args, elapsedTime, sock=None):
+        data, calls, shortWrites = (now - before for now, before in zip((self.data, self.calls, self.shortWrites), self.omitted))
+        return format_row(self.name, self.omitEnd, elapsedTime, data, args, kind='summary', sock=sock, target=args.bitrate, calls=calls, shortWrites=shortWrites)
+
+# Define a function to end the --omit warm-up of the streams after that many seconds, returning its timer to cancel
+def start_omit_timer(streams, args):
+    if not args.omit:
+        return None
+    timer = threading.Timer(args.omit, lambda: [stream.omit(args.omit) for stream in streams])
+    timer.daemon = True
+    timer.start()
+    return timer
+
+# Counters a client worker shares per stream
+SHARED_COUNTERS = 3
+
+# Define a function to create a property stored in shared memory, in the 'offset' block of one slot per stream
+def shared_counter(offset):
+    return property(lambda self: self.counters[offset * self.stride + self.slot],
+                    lambda self, value: self.counters.__setitem__(offset * self.stride + self.slot, value))
+
+# A stream of a client worker process, whose counters live in shared memory so the parent can report them. The
+# array holds a block of one slot per stream for each counter: bytes, then calls, then short writes
+class SharedStream(Stream):
+    def __init__(self, sock, counters, slot, direction=''):
+        self.counters = counters
+        self.slot = slot
+        self.stride = len(counters) // SHARED_COUNTERS
+        super().__init__(sock, direction)
+
+    data = shared_counter(0)
+    calls = shared_counter(1)
+    shortWrites = shared_counter(2)
+
+
+# Paces a sender to a target bitrate. Each send is given a deadline computed from the start and the bytes sent
+# so far, so timing errors do not accumulate, and the sender only sleeps once it is more than SLACK ahead,
+# sending the packets due in between back to back instead of sleeping before every packet. After a stall
+# at most BURST seconds of sending is caught up, like the depth of a token bucket. At a low rate the sender
+# hands over QUANTUM seconds of data at a time instead of a whole block, so the rate holds within an interval
+class Pacer:
+    SLACK = 0.001
+    BURST = 0.01
+    QUANTUM = 0.005
+
+    def __init__(self, bitrate):
+        self.rate = bitrate / 8 # Bytes per second, 0 sends as fast as possible
+        self.startTime = time.monotonic()
+        self.sent = 0
+
+    # Return how long to sleep before sending 'size' bytes, and count them as sent
+    def delay(self, size):
+        if not self.rate:
+            return 0
+        now = time.monotonic()
+        due = self.startTime + self.sent / self.rate
+        if due < now - self.BURST:
+            # Fallen behind; forget the missed sending time instead of bursting to make up for it
+            self.startTime += now - self.BURST - due
+            due = now - self.BURST
+        self.sent += size
+        return due - now if due - now > self.SLACK else 0
+
+    # Define a function to return how many bytes to send at once: the block of 'length' bytes, or less at a low rate
+    def quantum(self, length):
+        return min(length, max(MIN_LENGTH, int(self.rate * self.QUANTUM))) if self.rate else length
+
+    # Sleep until 'size' bytes may be sent, but not past 'deadline' (time.monotonic), and return whether to send
+    def wait(self, size, deadline=None):
+        delay = self.delay(size)
+        if deadline is not None:
+            delay = min(delay, deadline - time.monotonic())
+        if delay > 0:
+            time.sleep(delay)
+        return deadline is None or time.monotonic() < deadline
+
+
+# Define a function to let the kernel pace a TCP socket to a bitrate, so the packets of each block leave
+# evenly spaced instead of as one burst. Kernels without SO_MAX_PACING_RATE are left to the Pacer alone
+def set_pacing_rate(sock, bitrate):
+    if SO_MAX_PACING_RATE is None:
+        return
+    rate = int(bitrate / 8) # Bytes per second
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, SO_MAX_PACING_RATE, rate if rate < 2**31 else struct.pack('=Q', rate))
+    except OSError:
+        pass
+
+
+# Histogram of latencies in microseconds with fixed memory, in the style of HdrHistogram: values below SUB are
+# counted exactly, above that each power of two is split into SUB / 2 linear buckets, so every value is
+# within 1 / (SUB / 2) of its bucket whatever the magnitude
+class LatencyHistogram:
+    SUB_BITS = 8
+    SUB = 1 << SUB_BITS
+    HALF = SUB >> 1
+    MAX_BITS = 40 # About 12 days in microseconds, anything above is counted in the last bucket
+
+    def __init__(self):
+        self.counts = [0] * (self.SUB + (self.MAX_BITS - self.SUB_BITS) * self.HALF)
+        self.total = 0
+        self.max = 0
+
+    def index(self, value):
+        if value < self.SUB:
+            return value
+        magnitude = min(value.bit_length(), self.MAX_BITS) - self.SUB_BITS
+        return min(self.SUB + (magnitude - 1) * self.HALF + (value >> magnitude) - self.HALF, len(self.counts) - 1)
+
+    # Highest value counted in a bucket
+    def bucket_value(self, index):
+        if index < self.SUB:
+            return index
+        magnitude = (index - self.SUB) // self.HALF + 1
+        return (((index - self.SUB) % self.HALF + self.HALF + 1) << magnitude) - 1
+
+    def record(self, value):
+        self.counts[self.index(value)] += 1
+        self.total += 1
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        for i, count in enumerate(other.counts):
+            if count:
+                self.counts[i] += count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def percentile(self, percent):
+        if not self.total:
+            return 0
+        rank = percent / 100 * self.total
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                return min(self.bucket_value(i), self.max)
+        return self.max
+
+
+# Percentiles reported by the latency mode
+LATENCY_PERCENTILES = (50, 90, 99, 99.9)
+LATENCY_COLUMNS = '\t'.join(f'p{p:g} ms' for p in LATENCY_PERCENTILES) + '\tMax ms'
+LATENCY_TITLE = 'ID\t\tInterval\tTransactions\t' + LATENCY_COLUMNS
+
+# Define a function to format one row of the latency report from a histogram of microseconds. 'count' names
+# what the histogram counted in the JSON record, i.e. connections for the setup latency of --short-flows
+def format_latency_row(name, startInterval, endInterval, histogram, args, kind='latency_interval', count='transactions', **extra):
+    duration = endInterval - startInterval
+    rate = histogram.total / duration if duration > 0 else 0
+    if args.json:
+        return json.dumps({'type': kind, 'stream': name, 'start': round(startInterval, 6), 'end': round(endInterval, 6), count: histogram.total,
+                           f'{count}_per_second': rate, **{f'p{p:g}_us': histogram.percentile(p) for p in LATENCY_PERCENTILES}, 'max_us': histogram.max, **extra})
+    percentiles = '\t'.join(f'{histogram.percentile(p) / 1000:.3f}' for p in LATENCY_PERCENTILES)
+    return f"{name}\t{startInterval:.1f} - {endInterval:.1f}\t{histogram.total} ({rate:.0f}/s)\t{percentiles}\t{histogram.max / 1000:.3f}"
+
+
+# Function running back-to-back request/response transactions of --request-size bytes over TCP, or over UDP
+# with -u, printing latency percentiles every interval until -t has passed or 'stop' is set
+def run_latency(args: argparse.Namespace, stop, results=outResult):
+    size = args.request_size
+    request = bytearray(b'0') * size
+    reply = bytearray(size)
+    replyView = memoryview(reply)
+    if args.udp:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.connect((args.serverip, args.port))
+        sock.settimeout(1) # A reply missing for a second is counted as lost
+    else:
+        sock = socket.create_connection((args.serverip, args.port))
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1) # Send every request at once
+        sock.sendall(pack_header('echo', args))
+    clientIp, clientPort = sock.getsockname()
+    # Next to the bulk rows of --load, the latency rows are marked like the direction of a stream
+    name = f'[LAT] {clientIp}:{clientPort}' if args.load and not args.json else f'{clientIp}:{clientPort}'
     
-    clientIp, clientPort = clientSocket.getsockname()
+    intervalHistogram = LatencyHistogram()
+    totalHistogram = LatencyHistogram()
+    lost = seq = 0
+    startTime = time.monotonic()
+    endTime = startTime + args.time
+    nextInterval = startTime + args.interval if args.interval else endTime
+    try:
+        while not stop.is_set():
+            now = time.monotonic()
+            if now >= nextInterval and args.interval:
+                # Report and restart the interval histogram, on a schedule fixed to the start so it does not drift
+                print(format_latency_row(name, nextInterval - startTime - args.interval, nextInterval - startTime, intervalHistogram, args), flush=True)
+                totalHistogram.merge(intervalHistogram)
+                intervalHistogram = LatencyHistogram()
+                nextInterval += args.interval
+            if now >= endTime:
+                break
+            
+            sentNs = time.perf_counter_ns()
+            if args.udp:
+                seq += 1
+                UDP_HEADER.pack_into(request, 0, UDP_ECHO, seq, sentNs)
+                sock.send(request)
+                try:
+                    # Skip late replies to earlier requests until this one arrives
+                    while sock.recv_into(reply) < UDP_HEADER.size or UDP_HEADER.unpack_from(reply)[1] != seq:
+                        pass
+                except socket.timeout:
+                    lost += 1
+                    continue
+            else:
+                sock.sendall(request)
+                received = 0
+                while received < size:
+                    chunk = sock.recv_into(replyView[received:])
+                    if not chunk:
+                        raise ConnectionError('Server closed the connection')
+                    received += chunk
+            intervalHistogram.record((time.perf_counter_ns() - sentNs) // 1000)
+        
+        # With --load the bulk streams may end the test between two boundaries: report the interval so far,
+        # unless it is shorter than a tenth of an interval
+        if args.interval:
+            startInterval, endInterval = nextInterval - startTime - args.interval, time.monotonic() - startTime
+            if endInterval - startInterval >= args.interval / 10:
+                print(format_latency_row(name, startInterval, endInterval, intervalHistogram, args), flush=True)
+        
+        if not args.udp:
+            # End the test like a transfer: half-close and wait for the server's stats record
+            sock.shutdown(socket.SHUT_WR)
+            recv_exact(sock, STATS.size)
+    except (socket.error, ConnectionError) as e:
+        print_error(args, f'{name}: {e}')
+    sock.close()
+    
+    totalHistogram.merge(intervalHistogram)
+    elapsedTime = time.monotonic() - startTime
+    if args.json:
+        results.append(format_latency_row(name, 0, elapsedTime, totalHistogram, args, kind='latency_summary', **({'lost': lost} if args.udp else {})))
+    else:
+        results.append(LATENCY_TITLE)
+        results.append(format_latency_row(name, 0, elapsedTime, totalHistogram, args) + (f'\t{lost} lost' if args.udp else ''))
 
-    # Print results for each interval every second requested by user-input 'args.interval'
-    def print_interval():
-        startSent = 0 # Supporting variable to calculate how much data was sent during an interval
-        startTime = time.time()
-        currentTime = startTime
-        currentSent = 0
-        if mode == 'time':
-            # Print intervals within user-inputted time-frame
-            while currentTime < endTime:
-                time.sleep(args.interval)
-                currentTime = time.time()
-                elapsedTime = currentTime - startTime
-                startInterval = elapsedTime - args.interval
-                
-                currentSent = dataSent
-                diffSent = currentSent - startSent
-                startSent = currentSent
-                
-                formatSent = parse_size_result(diffSent, args.format)
-                bandwidth = formatSent / elapsedTime
-                if args.format.lower() == 'mb': # Print out total number of bytes received with two decimals if requested format is in 'MB'
-                    print(f"{clientIp}:{clientPort}\t{startInterval:.1f} - {elapsedTime:.1f}\t{formatSent:.2f} {args.format}\t{bandwidth:.2f} Mbps")
-                else: # Print out total bytes as a whole number if requested format is a smaller form than 'MB'
-                    print(f"{clientIp}:{clientPort}\t{startInterval:.1f} - {elapsedTime:.1f}\t{int(formatSent)} {args.format}\t{bandwidth:.2f} Mbps")
-               
-        elif mode == 'num':
-            # Print intervals within user-inputted max-data
-            while currentSent < parse_size(args.num): # Parse args.num in bits 
-                time.sleep(args.interval)
-                currentTime = time.time()
-                elapsedTime = currentTime - startTime
-                startInterval = elapsedTime - args.interval
-                
-                currentSent = dataSent
-                diffSent = currentSent - startSent
-                startSent = currentSent
-                
-                formatSent = parse_size_result(diffSent, args.format)
-                bandwidth = formatSent / elapsedTime
-                
-                if args.format.lower() == 'mb': # Print out total number of bytes received with two decimals if requested format is in 'MB'
-                    print(f"{clientIp}:{clientPort}\t{startInterval:.1f} - {elapsedTime:.1f}\t{formatSent:.2f} {args.format}\t{bandwidth:.2f} Mbps")
-                else: # Print out total bytes as a whole number if requested format is a smaller form than 'MB'
-                    print(f"{clientIp}:{clientPort}\t{startInterval:.1f} - {elapsedTime:.1f}\t{int(formatSent)} {args.format}\t{bandwidth:.2f} Mbps")
-               
+
+# Short-flow mode (--short-flows). Small requests on fresh connections are dominated by the handshake, so each
+# variant reports the connection setup latency next to the transaction latency: 'fresh' opens a connection for
+# every transaction and closes it after the response, 'pooled' reuses -P connections opened once
+SHORT_FLOW_VARIANTS = ('fresh', 'pooled')
+SHORT_FLOW_TITLE = 'ID\t\tInterval\tCount\t\t' + LATENCY_COLUMNS
+
+# One thread of the short-flow mode, running back-to-back transactions of --request-size bytes answered with
+# --response-size bytes. The histograms hold the current interval, swapped out under the lock by the reporter
+class ShortFlowClient:
+    def __init__(self, args, variant):
+        self.args = args
+        self.fresh = variant == 'fresh'
+        self.request = bytes(args.request_size)
+        self.firstRequest = pack_header('rr', args) + self.request # Header and request in one write on a fresh connection
+        self.reply = memoryview(bytearray(args.response_size))
+        self.lock = threading.Lock()
+        self.setup = LatencyHistogram()
+        self.transactions = LatencyHistogram()
+
+    # Open a connection to the server, recording how long the handshake took
+    def connect(self):
+        startNs = time.perf_counter_ns()
+        sock = socket.create_connection((self.args.serverip, self.args.port))
+        with self.lock:
+            self.setup.record((time.perf_counter_ns() - startNs) // 1000)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1) # Send every request at once
+        return sock
+
+    def receive(self, sock):
+        received = 0
+        while received < len(self.reply):
+            chunk = sock.recv_into(self.reply[received:])
+            if not chunk:
+                raise ConnectionError('Server closed the connection')
+            received += chunk
+
+    # Run transactions until 'endTime'. A fresh transaction is timed from the start of its connect, so it
+    # includes the handshake, the way a client of short connections sees it
+    def run(self, endTime):
+        sock = None
+        try:
+            if not self.fresh:
+                sock = self.connect()
+                sock.sendall(pack_header('rr', self.args))
+            while time.monotonic() < endTime:
+                startNs = time.perf_counter_ns()
+                if self.fresh:
+                    sock = self.connect()
+                    sock.sendall(self.firstRequest)
+                else:
+                    sock.sendall(self.request)
+                self.receive(sock)
+                if self.fresh:
+                    sock.close()
+                    sock = None
+                with self.lock:
+                    self.transactions.record((time.perf_counter_ns() - startNs) // 1000)
+        except (socket.error, ConnectionError) as e:
+            print_error(self.args, f'{self.args.serverip}:{self.args.port}: {e}')
+        if sock:
+            sock.close()
+
+    # Hand over the histograms of the interval that just ended and start new ones
+    def take(self):
+        with self.lock:
+            setup, transactions = self.setup, self.transactions
+            self.setup, self.transactions = LatencyHistogram(), LatencyHistogram()
+        return setup, transactions
+
+
+# Define a function to format the setup and transaction rows of one variant of the short-flow mode
+def format_short_flow_rows(variant, startInterval, endInterval, setup, transactions, args, kind='short_flow_interval'):
+    return [format_latency_row(f'{variant} connect', startInterval, endInterval, setup, args, kind=kind, count='connections', variant=variant, latency='connect'),
+            format_latency_row(f'{variant} request', startInterval, endInterval, transactions, args, kind=kind, variant=variant, latency='request')]
+
+# Function running the short-flow mode: each variant in turn runs -P threads of transactions for -t seconds,
+# printing the connection and transaction rates with their latency percentiles every interval
+def run_short_flows(args: argparse.Namespace):
+    variants = SHORT_FLOW_VARIANTS if args.short_flows == 'both' else (args.short_flows,)
     if args.interval:
-        intervalThread = threading.Thread(target=print_interval)
-        intervalThread.start()
+        print_text(args, SHORT_FLOW_TITLE)
+    for variant in variants:
+        clients = [ShortFlowClient(args, variant) for _ in range(args.parallel)]
+        startTime = time.monotonic()
+        endTime = startTime + args.time
+        threads = [threading.Thread(target=client.run, args=(endTime,)) for client in clients]
+        for thread in threads:
+            thread.start()
+        
+        totalSetup, totalTransactions = LatencyHistogram(), LatencyHistogram()
+        nextInterval = startTime + args.interval if args.interval else endTime
+        while args.interval and nextInterval <= endTime and any(thread.is_alive() for thread in threads):
+            time.sleep(max(0, nextInterval - time.monotonic()))
+            # Merge every thread's interval into one row per latency, on a schedule fixed to the start so it does not drift
+            setup, transactions = LatencyHistogram(), LatencyHistogram()
+            for client in clients:
+                clientSetup, clientTransactions = client.take()
+                setup.merge(clientSetup)
+                transactions.merge(clientTransactions)
+            for row in format_short_flow_rows(variant, nextInterval - startTime - args.interval, nextInterval - startTime, setup, transactions, args):
+                print(row, flush=True)
+            totalSetup.merge(setup)
+            totalTransactions.merge(transactions)
+            nextInterval += args.interval
+        
+        for thread in threads:
+            thread.join()
+        for client in clients:
+            clientSetup, clientTransactions = client.take()
+            totalSetup.merge(clientSetup)
+            totalTransactions.merge(clientTransactions)
+        elapsedTime = time.monotonic() - startTime
+        if not args.json and variant == variants[0]:
+            outResult.append(SHORT_FLOW_TITLE)
+        outResult.extend(format_short_flow_rows(variant, 0, elapsedTime, totalSetup, totalTransactions, args, kind='short_flow_summary'))
+
+
+# Payload source for -Z: the file given with -F, or a memfd holding one block, which the kernel sends from with
+# sendfile so the payload never enters Python. Each stream keeps its own offset and wraps around at the end
+class SendfileSource:
+    def __init__(self, args):
+        if args.file:
+            self.file = open(args.file, 'rb')
+        else:
+            self.file = os.fdopen(os.memfd_create('simpleperf'), 'w+b') if hasattr(os, 'memfd_create') else tempfile.TemporaryFile()
+            self.file.write(b'0' * args.length)
+            self.file.flush()
+        self.size = os.fstat(self.file.fileno()).st_size
+        if not self.size:
+            raise ValueError(f'{args.file} is empty')
+        self.offset = 0
+
+    # Define a function to return a source sending from the same file with an offset of its own, so many streams
+    # share one memfd. Only the original is closed
+    def share(self):
+        source = copy.copy(self)
+        source.offset = 0
+        return source
+
+    def advance(self, sent):
+        self.offset = (self.offset + sent) % self.size
+        return sent
+
+    def send(self, sock, count):
+        return self.advance(os.sendfile(sock.fileno(), self.file.fileno(), self.offset, min(count, self.size - self.offset)))
+
+    def close(self):
+        self.file.close()
+
+
+# Function to send the payload of one stream for -t seconds, or until 'totalSize' bytes are written with -n. The
+# client sends with it, and so does the server on a reverse (-R) connection
+def send_payload(stream, args, mode, totalSize=0):
+    dataPacket = bytearray(b'0') * args.length # Allocate one block of '0'-bytes of size -l/--length, reused for every send
+    dataView = memoryview(dataPacket) # Slicing a memoryview does not copy the block
     
-    start_time = time.time()
+    sock = stream.sock
+    # With -Z the kernel sends from a file or memfd with sendfile, otherwise the block is handed to send
+    if args.zerocopy:
+        source = SendfileSource(args)
+        sendBlock = lambda count: source.send(sock, count)
+    else:
+        sendBlock = lambda count: sock.send(dataView if count == args.length else dataView[:count])
+    # With --bitrate the writes are paced in userspace, which keeps the reported rates true, and the kernel spaces the packets
+    pacer = Pacer(args.bitrate)
+    blockSize = pacer.quantum(args.length)
+    if args.bitrate:
+        set_pacing_rate(sock, args.bitrate)
+
+    deadline = time.monotonic() + args.time
+    stopFlag = args.stopFlag # Set by --adaptive to end the test before -t
     # If client is invoked with argument -t or --time
     if mode == 'time':
         try:
         # While elapsed time <= args.time
-            while time.time() - start_time < args.time:
-                # Continously send packets to server and keep track of how many packets sent
-                clientSocket.send(dataPacket.encode()) 
-                dataSent += len(dataPacket)
+            while time.monotonic() < deadline and not (stopFlag and stopFlag.value):
+                # Continously send the block to server and count the bytes the kernel accepted, which may be less than the block.
+                # The pacer never sleeps past the end of the test
+                if not pacer.wait(blockSize, deadline):
+                    break
+                sent = sendBlock(blockSize)
+                stream.data += sent
+                stream.calls += 1
+                if sent < blockSize:
+                    stream.shortWrites += 1
             
         except socket.error:
             pass
@@ -226,65 +1326,597 @@ def send_data(clientSocket, args, mode, endTime):
     # If client is invoked with argument -n or --num
     elif mode == 'num':
         try:
-            # While the amount of data sent <= user-inputted max data TO BE sent
-            while dataSent <= parse_size(args.num):
-                clientSocket.send(dataPacket.encode())
-                dataSent += len(dataPacket)
+            # While the amount of data sent < user-inputted max data TO BE sent
+            while stream.data < totalSize:
+                # Only send what is remaining of the total so exactly -n bytes are written
+                count = min(blockSize, totalSize - stream.data)
+                pacer.wait(count)
+                sent = sendBlock(count)
+                stream.data += sent
+                stream.calls += 1
+                if sent < count:
+                    stream.shortWrites += 1
         except socket.error:
             pass
-              
-    if args.interval:
-                intervalThread.join()
-                
-    # After total time or max data is exceeded, client sends confirmation to the server
-    clientSocket.sendall('BYE'.encode()) 
     
-    # Client waits for server's response 
-    message = clientSocket.recv(1024)
+    if args.zerocopy:
+        source.close()
+
+
+def send_data(stream, args, mode, endTime):
+    clientSocket = stream.sock
+    clientIp, clientPort = clientSocket.getsockname()
+    
+    # Announce the test to the server before any payload is sent
+    clientSocket.sendall(pack_header(mode, args))
+    send_payload(stream, args, mode, parse_size(args.num) if mode == 'num' else 0)
+              
+    # After total time or max data is exceeded, client half-closes the connection to tell the server all data is sent
+    try:
+        clientSocket.shutdown(socket.SHUT_WR)
+        # Client waits for server's stats record, which tells that the server has received everything sent
+        recv_exact(clientSocket, STATS.size)
+    except (socket.error, ConnectionError) as e:
+        print_error(args, f'{clientIp}:{clientPort}: no stats record from server: {e}')
 
     # Process data to be used in result(s)
     elapsedTime = time.time() - (endTime - args.time)
-    dataSize = parse_size_result(dataSent, args.format)
-    bandwidth = (parse_size_result(dataSent, 'MB')*8) / elapsedTime
-    
-    if args.format.lower() == 'mb': # Print out total number of bytes received with two decimals if requested format is in 'MB'
-        outResult.append(f"{clientIp}:{clientPort}\t{startInterval:.1f} - {elapsedTime:.1f}\t{dataSize:.2f} {args.format}\t{bandwidth:.2f} Mbps")
-    else: # Print out total bytes as a whole number if requested format is a smaller form than 'MB'
-        outResult.append(f"{clientIp}:{clientPort}\t{startInterval:.1f} - {elapsedTime:.1f}\t{int(dataSize)} {args.format}\t{bandwidth:.2f} Mbps")
+    outResult.append(stream.summary(args, elapsedTime, sock=clientSocket))
                
     clientSocket.close()
+
+
+# Function to receive the payload the server sends on a reverse stream (-R or --bidir). The roles of the
+# control protocol are swapped: the server half-closes when done, and the client answers with the stats record
+def receive_data(stream, args, mode, endTime):
+    buffer = bytearray(args.length)
+    clientSocket = stream.sock
+    
+    clientSocket.sendall(pack_header(mode, args, reverse=True))
+    startTime = time.time()
+    try:
+        while True:
+            received = clientSocket.recv_into(buffer)
+            stream.calls += 1
+            if not received: # Server has sent all its data
+                break
+            stream.data += received
+        clientSocket.sendall(STATS.pack(stream.data, time.time() - startTime))
+    except (socket.error, ConnectionError) as e:
+        print_error(args, f'{stream.name}: {e}')
+    
+    elapsedTime = time.time() - (endTime - args.time)
+    outResult.append(stream.summary(args, elapsedTime, sock=clientSocket))
+    clientSocket.close()
         
 
-# Function to create thread(s) to be further connected to the addressed server    
-def connect_server(args: argparse.Namespace, mode):
-    # Prepare server's IP address and port
-    serverHost = args.serverip
-    serverPort = args.port
+# Define a coroutine to wait until a non-blocking socket has room to send again
+async def wait_writable(loop, sock):
+    writable = loop.create_future()
+    loop.add_writer(sock.fileno(), writable.set_result, None)
+    try:
+        await writable
+    finally:
+        loop.remove_writer(sock.fileno())
+
+# Coroutine sending on one stream until -t has passed or -n bytes are written
+async def async_send_data(loop, stream, args, mode, startEvent, endTime, dataView, sharedSource):
+    totalSize = parse_size(args.num) if mode == 'num' else 0
+    source = sharedSource.share() if sharedSource else None
+    # loop.sock_sendall hides how many send calls it makes, and loop.sock_sendfile checks the file on every call,
+    # so call send or sendfile directly on the non-blocking socket
+    if source:
+        sendCall = lambda count: source.send(stream.sock, count)
+    else:
+        sendCall = lambda count: stream.sock.send(dataView if count == args.length else dataView[:count])
+    pacer = Pacer(args.bitrate)
+    blockSize = pacer.quantum(args.length)
+    if args.bitrate:
+        set_pacing_rate(stream.sock, args.bitrate)
+    
+    # Send up to 'count' bytes with one send call and return how many were sent. Every call is counted, as well
+    # as each one the kernel took only part of, waiting for room in the socket buffer when it took nothing.
+    # The pacer never sleeps past 'deadline' (loop.time), and once it has passed nothing is sent and None returned
+    async def send_block(count, deadline=None):
+        delay = pacer.delay(count)
+        if deadline is not None:
+            delay = min(delay, deadline - loop.time())
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if deadline is not None and loop.time() >= deadline:
+            return None
+        while True:
+            stream.calls += 1
+            try:
+                sent = sendCall(count)
+                break
+            except BlockingIOError:
+                await wait_writable(loop, stream.sock)
+        if sent < count:
+            stream.shortWrites += 1
+        return sent
     
-    print('------------------------------------------------------------')
-    print(f'Simpleperf client(s) connecting to server {serverHost}, port {serverPort}')
-    print('------------------------------------------------------------')
+    await loop.sock_sendall(stream.sock, pack_header(mode, args))
+    await startEvent.wait() # Every stream starts sending at the same moment
     
+    try:
+        if mode == 'time':
+            while loop.time() < endTime and not (args.stopFlag and args.stopFlag.value):
+                sent = await send_block(blockSize, endTime)
+                if sent is None:
+                    break
+                stream.data += sent
+                await asyncio.sleep(0) # A send the kernel takes whole does not yield, so give the other streams a turn
+        elif mode == 'num':
+            while stream.data < totalSize:
+                stream.data += await send_block(min(blockSize, totalSize - stream.data))
+                await asyncio.sleep(0)
+        
+        # Half-close and wait for the server's stats record
+        stream.sock.shutdown(socket.SHUT_WR)
+        record = bytearray()
+        while len(record) < STATS.size:
+            chunk = await loop.sock_recv(stream.sock, STATS.size - len(record))
+            if not chunk:
+                raise ConnectionError('Connection closed before the stats record was received')
+            record += chunk
+    except (socket.error, ConnectionError) as e:
+        print_error(args, f'{stream.name}: no stats record from server: {e}')
+    stream.sock.close()
+
+
+# Coroutine receiving what the server sends on a reverse stream, then answering with the stats record
+async def async_receive_data(loop, stream, args, mode, startEvent, endTime, buffer):
+    await startEvent.wait() # The server starts sending as soon as it has the header, so hold it back until every stream starts
+    await loop.sock_sendall(stream.sock, pack_header(mode, args, reverse=True))
+    startTime = loop.time()
+    
+    try:
+        while True:
+            received = await loop.sock_recv_into(stream.sock, buffer)
+            stream.calls += 1
+            if not received: # Server has sent all its data
+                break
+            stream.data += received
+            await asyncio.sleep(0) # sock_recv_into does not yield while data is queued, so give the senders a turn
+        await loop.sock_sendall(stream.sock, STATS.pack(stream.data, loop.time() - startTime))
+    except (socket.error, ConnectionError) as e:
+        print_error(args, f'{stream.name}: {e}')
+    stream.sock.close()
+
+
+# Define a function to count the connections of the -P parallel streams; --bidir pairs a sending and a receiving connection
+def stream_count(args):
+    return args.parallel * 2 if args.bidir else args.parallel
+
+# Define a function to find the direction of the stream in a slot: every stream receives with -R, every second with --bidir
+def stream_direction(args, slot):
+    if args.reverse:
+        return 'RX'
+    if args.bidir:
+        return 'RX' if slot % 2 else 'TX'
+    return ''
+
+
+# Coroutine connecting all parallel streams concurrently and driving them from one event loop
+async def async_connect_server(args: argparse.Namespace, mode, worker=None):
+    loop = asyncio.get_running_loop()
+    
+    async def open_stream(index):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setblocking(False)
+        await loop.sock_connect(sock, (args.serverip, args.port))
+        direction = stream_direction(args, index)
+        return Stream(sock, direction) if worker is None else worker.make_stream(sock, index, direction)
+    
+    streams = await asyncio.gather(*(open_stream(i) for i in range(stream_count(args))))
+    if worker:
+        worker.ready(streams) # Wait until the streams of every worker are connected
+    
+    startEvent = asyncio.Event()
+    startTime = loop.time()
+    endTime = startTime + args.time
+    # The payload is never written and what is received is discarded, so every stream shares one block to send
+    # from (or one memfd with -Z) and one receive buffer, instead of allocating -l bytes each
+    dataView = memoryview(bytearray(b'0') * args.length)
+    source = SendfileSource(args) if args.zerocopy and any(stream.direction != 'RX' for stream in streams) else None
+    buffer = bytearray(args.length) if any(stream.direction == 'RX' for stream in streams) else None
+    senders = [asyncio.create_task(async_receive_data(loop, stream, args, mode, startEvent, endTime, buffer) if stream.direction == 'RX' else
+                                   async_send_data(loop, stream, args, mode, startEvent, endTime, dataView, source))
+               for stream in streams]
+    
+    reporter = None
+    if worker is None:
+        print_text(args, 'ID\t\tInterval\tTransfer\tBandwidth')
+        reporter = IntervalReporter.for_streams(streams, args)
+    startEvent.set()
+    omitTimer = start_omit_timer(streams, args)
+    
+    await asyncio.gather(*senders)
+    if source:
+        source.close()
+    
+    elapsedTime = loop.time() - startTime
+    if omitTimer:
+        omitTimer.cancel()
+    for stream in streams:
+        outResult.append(stream.summary(args, elapsedTime))
+    if reporter:
+        reporter.stop()
+
+
+# Function to connect the parallel streams and send on each from its own thread
+def threaded_connect_server(args: argparse.Namespace, mode, worker=None):
     connections = []
     threads = []
     
     # Create the amount of parallel connections requested
-    for i in range(args.parallel):
+    for i in range(stream_count(args)):
         clientSocket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        clientSocket.connect((serverHost, serverPort))
-        connections.append(clientSocket)
+        clientSocket.connect((args.serverip, args.port))
+        direction = stream_direction(args, i)
+        connections.append(Stream(clientSocket, direction) if worker is None else worker.make_stream(clientSocket, i, direction))
+    if worker:
+        worker.ready(connections) # Wait until the streams of every worker are connected
         
+    reporter = None
+    if worker is None:
+        print_text(args, 'ID\t\tInterval\tTransfer\tBandwidth')
+        reporter = IntervalReporter.for_streams(connections, args)
     endTime = time.time() + args.time
+    omitTimer = start_omit_timer(connections, args)
     
     for clients in connections:
-        t = threading.Thread(target=send_data, args=(clients, args, mode, endTime))
+        t = threading.Thread(target=receive_data if clients.direction == 'RX' else send_data, args=(clients, args, mode, endTime))
         t.start()
         threads.append(t)
     
-    print('ID\t\tInterval\tTransfer\tBandwidth')
+    for thread in threads:
+        thread.join()
+    if omitTimer:
+        omitTimer.cancel()
+    if reporter:
+        reporter.stop()
+
+
+# Share of the parallel streams run by one client worker process. The streams' byte counts live in shared
+# memory, their names go to the parent once connected, and a barrier gives every worker the same start
+class ClientWorker:
+    def __init__(self, firstSlot, count, counters, barrier, queue):
+        self.firstSlot = firstSlot
+        self.count = count
+        self.counters = counters
+        self.barrier = barrier
+        self.queue = queue
+
+    def make_stream(self, sock, index, direction=''):
+        return SharedStream(sock, self.counters, self.firstSlot + index, direction)
+
+    def ready(self, streams):
+        self.queue.put(('streams', self.firstSlot, [stream.name for stream in streams]))
+        self.barrier.wait()
+
+
+# Function run in each client worker process; its report rows are handed to the parent when done
+def client_worker(args: argparse.Namespace, mode, worker):
+    args.parallel = worker.count
+    args.interval = None # The parent prints the intervals of every worker's streams
+    try:
+        if args.engine == 'asyncio':
+            asyncio.run(async_connect_server(args, mode, worker))
+        else:
+            threaded_connect_server(args, mode, worker)
+    except Exception as e:
+        worker.barrier.abort() # Release the parent and the other workers instead of leaving them waiting
+        print_error(args, f'Client worker: {e}')
+    worker.queue.put(('results', worker.firstSlot, outResult))
+
+
+# Function to spread the parallel streams across client worker processes and combine their reports
+def run_client_workers(args: argparse.Namespace, mode):
+    context = multiprocessing.get_context('fork')
+    workerCount = min(args.workers, args.parallel)
+    streams = stream_count(args)
+    counters = context.RawArray('q', SHARED_COUNTERS * streams) # Counters of every stream, written by the workers and read by the parent
+    barrier = context.Barrier(workerCount + 1)
+    queue = context.Queue()
+    
+    workers = []
+    firstSlot = 0
+    for i in range(workerCount):
+        count = args.parallel // workerCount + (1 if i < args.parallel % workerCount else 0)
+        workers.append(context.Process(target=client_worker, args=(args, mode, ClientWorker(firstSlot, count, counters, barrier, queue))))
+        firstSlot += count * 2 if args.bidir else count # Each parallel stream takes two slots with --bidir
+    for worker in workers:
+        worker.start()
+    
+    try:
+        barrier.wait()
+    except threading.BrokenBarrierError:
+        print_error(args, 'Error: a client worker could not connect to the server')
+    startTime = time.monotonic()
+    
+    names = [''] * streams
+    results = {}
+    reporter = None
+    # Every worker first sends the names of its streams, then its report rows when it is done. A worker that
+    # failed to connect only sends its report rows, so count the reports rather than the messages
+    finished = 0
+    while finished < workerCount:
+        try:
+            kind, slot, items = queue.get(timeout=1)
+        except Empty:
+            if not any(worker.is_alive() for worker in workers):
+                break # Every worker has exited, some without a report
+            continue
+        if kind == 'streams':
+            names[slot:slot + len(items)] = items
+            if all(names):
+                # The parent reports the intervals of every worker's streams from the counters in shared memory
+                print_text(args, 'ID\t\tInterval\tTransfer\tBandwidth')
+                reporter = IntervalReporter(names, lambda: counters[:streams], args, startTime, directions=[stream_direction(args, slot) for slot in range(streams)],
+                                            calls=lambda: list(zip(counters[streams:2 * streams], counters[2 * streams:])),
+                                            cpu=lambda: process_cpu([worker.pid for worker in workers]))
+        else:
+            results[slot] = items
+            finished += 1
+    
+    for worker in workers:
+        worker.join()
+    for slot in sorted(results):
+        outResult.extend(results[slot])
+    if reporter:
+        reporter.stop()
+
+
+# Function to create the parallel connections to the addressed server with the chosen engine
+def connect_server(args: argparse.Namespace, mode):
+    # Prepare server's IP address and port
+    serverHost = args.serverip
+    serverPort = args.port
+    
+    print_text(args, '------------------------------------------------------------')
+    print_text(args, f'Simpleperf client(s) connecting to server {serverHost}, port {serverPort}')
+    print_text(args, '------------------------------------------------------------')
+    
+    # With --start-at the client waits for a moment on the wall clock, so clients on several hosts start together
+    if args.start_at:
+        delay = args.start_at - time.time()
+        if delay > 0:
+            time.sleep(delay)
+    
+    if args.short_flows:
+        run_short_flows(args)
+        return
+    
+    # The latency transactions run in their own thread, alone or next to the bulk streams with --load
+    if args.latency:
+        stop = threading.Event()
+        # Under --load the latency summary is kept apart and added after the bulk rows, so each is under its own title
+        latencyResults = [] if args.load else outResult
+        if args.load and args.interval:
+            print_text(args, '[LAT] ' + LATENCY_TITLE)
+        latencyThread = threading.Thread(target=run_latency, args=(args, stop, latencyResults))
+        latencyThread.start()
+        if not args.load:
+            if args.interval:
+                print_text(args, LATENCY_TITLE) # The summary comes with its own title
+            latencyThread.join()
+            return
+    
+    # With --adaptive the reporter ends the test through a flag in shared memory, seen by the senders of every worker
+    if args.adaptive:
+        args.stopFlag = multiprocessing.get_context('fork').RawValue('b', 0)
     
+    if args.udp:
+        udp_connect_server(args, mode)
+    elif args.workers > 1:
+        run_client_workers(args, mode)
+    # With the asyncio engine every stream is driven from one event loop instead of one thread each
+    elif args.engine == 'asyncio':
+        asyncio.run(async_connect_server(args, mode))
+    else:
+        threaded_connect_server(args, mode)
+    
+    if args.latency:
+        stop.set() # With -n the latency thread ends together with the bulk streams
+        latencyThread.join()
+        outResult.extend(latencyResults)
+
+# UDP mode (-u). Every datagram starts with its type, a sequence number and the sender's clock, so the server
+# can count loss, reordering and jitter per stream with a handful of counters and no per-packet history
+UDP_DATA, UDP_FIN, UDP_REPORT, UDP_ECHO = 0, 1, 2, 3 # UDP_ECHO datagrams are sent straight back, for latency
+UDP_HEADER = struct.Struct('!BQq') # type, sequence number (datagrams sent for UDP_FIN), send time in ns
+UDP_REPORT_RECORD = struct.Struct('!BQQQQdd') # type, bytes, datagrams received, lost, out-of-order, jitter and elapsed in seconds
+UDP_DEFAULT_LENGTH = 1470 # Fits in one Ethernet frame with the IP and UDP headers, as iperf uses
+UDP_MAX_LENGTH = 65507
+UDP_FIN_RETRIES = 10 # Times the client resends its final datagram while waiting for the server's report
+
+
+# Counters of one UDP stream at the server, updated in O(1) per datagram
+class UdpStreamStats:
+    def __init__(self, addr):
+        self.addr = addr
+        self.startTime = time.monotonic()
+        self.data = self.packets = self.outOfOrder = 0
+        self.nextSeq = 0 # Sequence number expected next, one past the highest seen so far
+        self.jitter = 0.0
+        self.lastTransit = None
+        self.lastData = self.lastPackets = self.lastLost = self.lastOutOfOrder = 0 # Snapshot at the previous interval
+        self.lastTime = 0.0 # End of the previous interval in seconds since the stream began
+        self.intervals = 1 # Intervals printed so far plus one, so the next ends at startTime + intervals * -i
+        self.report = None # Final report, kept to answer a repeated final datagram
+
+    def on_data(self, seq, sentNs, size, arrivalNs):
+        self.data += size
+        self.packets += 1
+        if seq < self.nextSeq:
+            self.outOfOrder += 1 # Arrived after a later datagram; it was counted as lost until now
+        else:
+            self.nextSeq = seq + 1
+        # Interarrival jitter as in RFC 3550: a running average of the change in transit time. The clocks of
+        # client and server need not agree, as their offset cancels out in the difference
+        transit = (arrivalNs - sentNs) / 1e9
+        if self.lastTransit is not None:
+            self.jitter += (abs(transit - self.lastTransit) - self.jitter) / 16
+        self.lastTransit = transit
+
+    def lost(self, total=None):
+        return max(0, (self.nextSeq if total is None else total) - self.packets)
+
+    # Define a function to format the row of the interval since the previous one, ending 'endInterval' seconds
+    # after the stream began, and start the next interval there
+    def interval_row(self, endInterval, args):
+        lost = self.lost()
+        row = format_udp_row(self.addr, self.lastTime, endInterval, self.data - self.lastData, self.jitter, lost - self.lastLost,
+                             self.nextSeq - self.lastPackets - self.lastLost, self.outOfOrder - self.lastOutOfOrder, args)
+        self.lastData, self.lastPackets, self.lastLost, self.lastOutOfOrder = self.data, self.nextSeq - lost, lost, self.outOfOrder
+        self.lastTime = endInterval
+        self.intervals += 1
+        return row
+
+
+# Define a function to format one row of a UDP report: the TCP columns followed by jitter and loss
+def format_udp_row(name, startInterval, endInterval, data, jitter, lost, total, outOfOrder, args, kind='interval'):
+    percent = 100 * lost / total if total else 0
+    if args.json:
+        return format_row(str(name), startInterval, endInterval, data, args, kind, jitter_ms=jitter * 1000, lost=lost, total=total, out_of_order=outOfOrder)
+    return f"{format_row(name, startInterval, endInterval, data, args)}\t{jitter * 1000:.3f} ms\t{lost}/{total} ({percent:.2g}%)\t{outOfOrder}"
+
+UDP_REPORT_TITLE = 'ID\t\tInterval\tTransfer\tBandwidth\tJitter\t\tLost/Total Datagrams\tOut-of-order'
+
+
+# Function to receive UDP streams from every client on one socket, printing intervals with -i
+def start_udp_server(args: argparse.Namespace):
+    buffer = bytearray(UDP_MAX_LENGTH)
+    streams = {}
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as serverSocket:
+        serverSocket.bind((args.bind, args.port))
+        print_text(args, '------------------------------------------------')
+        print_text(args, f'A simpleperf server is listening on UDP port {args.port}')
+        print_text(args, '------------------------------------------------')
+        
+        selector = selectors.DefaultSelector()
+        selector.register(serverSocket, selectors.EVENT_READ)
+        try:
+            while True:
+                # Wake up at the next interval boundary of any active stream, each counted from that stream's own start
+                nextInterval = min((stream.startTime + stream.intervals * args.interval for stream in streams.values() if stream.report is None),
+                                   default=None) if args.interval else None
+                if selector.select(None if nextInterval is None else max(0, nextInterval - time.monotonic())):
+                    # Read every datagram already queued before looking at the clock again
+                    while True:
+                        try:
+                            size, addr = serverSocket.recvfrom_into(buffer, 0, socket.MSG_DONTWAIT)
+                        except BlockingIOError:
+                            break
+                        on_udp_datagram(serverSocket, buffer, size, addr, streams, args)
+                if args.interval:
+                    # Print the interval of every active stream that has reached the end of one
+                    now = time.monotonic()
+                    for stream in streams.values():
+                        if stream.report is None and now >= stream.startTime + stream.intervals * args.interval:
+                            print(stream.interval_row(now - stream.startTime, args), flush=True)
+        except KeyboardInterrupt:
+            print_text(args, 'Closing server')
+            sys.exit(1)
+
+
+# Define a function to account for one datagram at the server and answer final datagrams with the report
+def on_udp_datagram(serverSocket, buffer, size, addr, streams, args):
+    if size < UDP_HEADER.size:
+        return
+    kind, seq, sentNs = UDP_HEADER.unpack_from(buffer)
+    if kind == UDP_ECHO:
+        serverSocket.sendto(memoryview(buffer)[:size], addr)
+        return
+    stream = streams.get(addr)
+    if kind == UDP_DATA:
+        if stream is None or stream.report is not None: # New stream, or a new test from a reused port
+            stream = streams[addr] = UdpStreamStats(addr)
+            print_text(args, f'Client with {addr} is connected with {args.bind}:{args.port}.')
+            if args.interval:
+                print_text(args, UDP_REPORT_TITLE)
+        stream.on_data(seq, sentNs, size, time.time_ns())
+    elif kind == UDP_FIN and stream is not None:
+        if stream.report is None:
+            elapsedTime = time.monotonic() - stream.startTime
+            # A remainder shorter than a tenth of an interval is left to the total, as the client does
+            if args.interval and elapsedTime - stream.lastTime >= args.interval / 10:
+                print(stream.interval_row(elapsedTime, args), flush=True)
+            lost = stream.lost(seq)
+            stream.report = UDP_REPORT_RECORD.pack(UDP_REPORT, stream.data, stream.packets, lost, stream.outOfOrder, stream.jitter, elapsedTime)
+            print_text(args, UDP_REPORT_TITLE)
+            print(format_udp_row(stream.addr, 0, elapsedTime, stream.data, stream.jitter, lost, seq, stream.outOfOrder, args, kind='summary'), flush=True)
+        serverSocket.sendto(stream.report, addr)
+
+
+# Function to send one paced UDP stream and fetch the server's report for it
+def send_udp_data(stream, args, mode, endTime):
+    clientSocket = stream.sock
+    datagram = bytearray(b'0') * args.length # One datagram, only its header is rewritten for each send
+    totalSize = parse_size(args.num) if mode == 'num' else 0
+    pacer = Pacer(args.bitrate)
+    deadline = time.monotonic() + (endTime - time.time()) if mode == 'time' else None # The pacer never sleeps past the end of the test
+    seq = 0
+    
+    try:
+        while time.time() < endTime if mode == 'time' else stream.data < totalSize:
+            if not pacer.wait(len(datagram), deadline):
+                break
+            UDP_HEADER.pack_into(datagram, 0, UDP_DATA, seq, time.time_ns())
+            stream.data += clientSocket.send(datagram)
+            stream.calls += 1
+            seq += 1
+    except socket.error as e:
+        print_error(args, f'{stream.name}: {e}')
+    elapsedTime = time.time() - (endTime - args.time)
+    
+    # Tell the server how many datagrams were sent, and resend until its report arrives
+    clientSocket.settimeout(0.25)
+    report = None
+    for _ in range(UDP_FIN_RETRIES):
+        clientSocket.send(UDP_HEADER.pack(UDP_FIN, seq, time.time_ns()))
+        try:
+            reply = clientSocket.recv(UDP_REPORT_RECORD.size)
+        except socket.timeout:
+            continue
+        if len(reply) == UDP_REPORT_RECORD.size and reply[0] == UDP_REPORT:
+            report = UDP_REPORT_RECORD.unpack(reply)
+            break
+    clientSocket.close()
+    
+    if report is None:
+        outResult.append(format_row(stream.name, 0, elapsedTime, stream.data, args, kind='summary', server_report=False) if args.json else
+                         f'{format_row(stream.name, 0, elapsedTime, stream.data, args)}\tno report from server')
+    else:
+        kind, data, packets, lost, outOfOrder, jitter, serverElapsed = report
+        outResult.append(format_udp_row(stream.name, 0, elapsedTime, stream.data, jitter, lost, seq, outOfOrder, args, kind='summary'))
+
+
+# Function to send the parallel UDP streams, each from its own thread, with one interval reporter for all
+def udp_connect_server(args: argparse.Namespace, mode):
+    streams = []
+    for i in range(args.parallel):
+        clientSocket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        clientSocket.connect((args.serverip, args.port))
+        streams.append(Stream(clientSocket))
+    
+    # The client only knows what it sent, so its intervals have the TCP columns, and the server's jitter and loss
+    # come in the summary
+    if args.interval:
+        print_text(args, 'ID\t\tInterval\tTransfer\tBandwidth')
+    if not args.json:
+        outResult.append(UDP_REPORT_TITLE)
+    reporter = IntervalReporter.for_streams(streams, args)
+    endTime = time.time() + args.time
+    threads = [threading.Thread(target=send_udp_data, args=(stream, args, mode, endTime)) for stream in streams]
+    for thread in threads:
+        thread.start()
     for thread in threads:
         thread.join()
+    reporter.stop()
+
 
 def main():
             
@@ -293,12 +1925,20 @@ def main():
 
     # Add all options common for server and client
     parser.add_argument('-p','--port', type=int, default=8088, action=PortInRangeAction, help="Enter server's port: 1024 - 65535 (Default - 8080)")
+    parser.add_argument('-l','--length', type=str, default=DEFAULT_LENGTH, action=LengthInRangeAction, help="Enter size of each block written to or read from the socket: 1KB - 16MB (Default - 128KB).")
+    parser.add_argument('-e','--engine', type=str, default=None, choices=SERVER_ENGINES + CLIENT_ENGINES[1:], help="Enter how connections are driven. Server: selectors or threaded (Default - selectors). Client: threaded or asyncio (Default - threaded).")
+    parser.add_argument('-w','--workers', type=int, default=1, action=WorkersInRangeAction, help="Enter amount of processes to spread the server's clients or the client's parallel connections across (Default - 1).")
+    parser.add_argument('-u','--udp', action='store_true', help="Use UDP instead of TCP, reporting jitter, loss and reordering.")
+    parser.add_argument('-J','--json', action='store_true', help="Print one NDJSON record per interval and per stream summary instead of text, with TCP_INFO of each TCP stream.")
+    parser.add_argument('-C','--cpu', action='store_true', help="Report CPU time, send/receive calls, bytes per call and short writes along with the bandwidth.")
     parser.add_argument('-f','--format', type=str, default='MB', action=ValidFormatAction, help="Enter the format of the results in B, KB or MB (Default - MB).")
 
     # Create a group for server-arguments
     serverParser = parser.add_argument_group('Server')
     # Add all available options to invoke the server 
     serverParser.add_argument('-s', '--server', action='store_true',  help='Enable server mode.')
+    serverParser.add_argument('-B', '--backlog', type=int, default=socket.SOMAXCONN, help=f"Enter the maximum amount of clients waiting to be accepted (Default - {socket.SOMAXCONN}).")
+    serverParser.add_argument('-D', '--daemon', type=int, nargs='?', const=DAEMON_PORT, default=None, help=f"Run as a daemon taking tests from a coordinator on this control port; anyone reaching it can start tests from this host (Default - {DAEMON_PORT}).")
     serverParser.add_argument('-b', '--bind', type=str, default='127.0.0.1', help="Enter server's ip address using dotted commas.")
 
     # Create a group for client-arguments
@@ -306,9 +1946,23 @@ def main():
     # Add all available options to invoke the client
     clientParse.add_argument('-c', '--client', action='store_true', help='Enable client mode.')
     clientParse.add_argument('-I', '--serverip', type=str, default='127.0.0.1', help="Enter server's ip address using dotted commas (Default - 127.0.0.1)")
-    clientParse.add_argument('-i','--interval', type=int, default=None, action=LargerThanEqualZeroAction, help="Enter seconds between each interval and corresponding results (Default - Null).")
-    clientParse.add_argument('-P','--parallel', type=int, default=1, action=ParallelInRangeAction, help="Enter amount of parallel connections: 1-5 (Default - 1).")
+    clientParse.add_argument('-i','--interval', type=float, default=None, action=LargerThanEqualZeroAction, help="Enter seconds between each interval and corresponding results, i.e. 0.5 (Default - Null).")
+    clientParse.add_argument('-P','--parallel', type=int, default=1, action=ParallelInRangeAction, help=f"Enter amount of parallel connections: 1-{MAX_THREADED_PARALLEL} per worker, or up to {MAX_PARALLEL} with -e asyncio (Default - 1).")
+    clientParse.add_argument('--bitrate', type=str, default=None, action=ParseRateAction, help="Enter target bitrate per stream in bits/s with K, M or G, 0 for unlimited (Default - 1M with -u, unlimited over TCP).")
+    clientParse.add_argument('-L','--latency', action='store_true', help="Measure request/response latency percentiles with back-to-back transactions, over UDP with -u.")
+    clientParse.add_argument('--load', action='store_true', help="Run the -P bulk streams next to the latency transactions, to measure latency under load (requires -L).")
+    clientParse.add_argument('--request-size', type=int, default=LATENCY_REQUEST_SIZE, help=f"Enter size in bytes of each latency request and its answer, or of each --short-flows request (Default - {LATENCY_REQUEST_SIZE}).")
+    clientParse.add_argument('--short-flows', type=str, nargs='?', const='both', default=None, choices=[*SHORT_FLOW_VARIANTS, 'both'], help="Measure connections and transactions per second with setup latency percentiles, on a fresh connection per transaction, on -P pooled connections, or both one after the other (Default - both).")
+    clientParse.add_argument('--response-size', type=int, default=LATENCY_REQUEST_SIZE, help=f"Enter size in bytes of the response to each --short-flows request (Default - {LATENCY_REQUEST_SIZE}).")
+    clientParse.add_argument('-O','--omit', type=int, default=0, action=LargerThanZeroAction, help="Enter seconds of warm-up at the start of the test to leave out of the totals, added to -t (Default - 0).")
+    clientParse.add_argument('--adaptive', type=float, default=None, help="Enter a relative tolerance, i.e. 0.02, to end the test once the 95%% confidence interval of the throughput is within it, with -t as the longest duration (Default - Null).")
+    clientParse.add_argument('--start-at', type=float, default=None, help="Enter a Unix time in seconds at which to start the test, to start clients on several hosts at once (Default - Null).")
+    clientParse.add_argument('-Z','--zerocopy', action='store_true', help="Send with sendfile from a memfd (or the file given with -F), and let the server drain with splice.")
+    clientParse.add_argument('-F','--file', type=str, default=None, help="Enter a file to send with sendfile, implies -Z (Default - Null).")
     # Add an exclusivity to ensure only one of the arguments are provided at the time
+    directionGroup = clientParse.add_mutually_exclusive_group()
+    directionGroup.add_argument('-R','--reverse', action='store_true', help="Let the server send and the client receive.")
+    directionGroup.add_argument('--bidir', action='store_true', help="Send in both directions at once, on a pair of connections per parallel stream.")
     maxGroup = clientParse.add_mutually_exclusive_group() 
     maxGroup.add_argument('-n','--num', type=str, default='1234567890123B', action=ParseSizeAction, help="Enter total size of data to be sent: B, KB, MB (Cannot be used with -t or --time)")
     maxGroup.add_argument('-t','--time', type=int, default=25, action=LargerThanZeroAction, help="Enter total duration in seconds for which data should be generated (Cannot be used with -n or --num)")
@@ -317,12 +1971,77 @@ def main():
     # Parse the commands line arguments
     args = parser.parse_args()
 
+    # Resolve the engine for the chosen side and check that it exists there
+    if args.server and args.engine is None:
+        args.engine = SERVER_ENGINES[0]
+    elif args.client and args.engine is None:
+        args.engine = CLIENT_ENGINES[0]
+    if args.server and args.engine not in SERVER_ENGINES or args.client and args.engine not in CLIENT_ENGINES:
+        parser.error(f"engine '{args.engine}' is not available in {'server' if args.server else 'client'} mode.")
+    # One thread per stream does not scale, so only the asyncio engine may run more than a handful of streams
+    if args.client and args.engine == 'threaded' and args.parallel > MAX_THREADED_PARALLEL * args.workers:
+        parser.error(f"more than {MAX_THREADED_PARALLEL} parallel connections per worker require -e asyncio.")
+
+    # UDP has no congestion control, so it is only unlimited when asked for
+    if args.bitrate is None:
+        args.bitrate = UDP_DEFAULT_BITRATE if args.udp else 0
+
+    if args.udp:
+        # Datagrams default to one Ethernet frame, and cannot exceed the largest UDP payload
+        if args.length == DEFAULT_LENGTH:
+            args.length = UDP_DEFAULT_LENGTH
+        if args.length > UDP_MAX_LENGTH:
+            parser.error(f"-l cannot exceed {UDP_MAX_LENGTH} bytes with -u.")
+        if args.workers > 1 or args.zerocopy or args.file or args.client and args.engine != 'threaded':
+            parser.error("-u runs one thread per stream in a single process, without -w, -Z, -F or -e asyncio.")
+
+    if args.client and (args.reverse or args.bidir) and (args.udp or args.latency):
+        parser.error("-R and --bidir are only available for TCP throughput tests, without -u or -L.")
+
+    if args.client and (args.omit or args.adaptive) and (args.udp or args.latency):
+        parser.error("--omit and --adaptive are only available for TCP throughput tests, without -u or -L.")
+    if args.client and args.adaptive and (args.reverse or args.bidir or args.num != '1234567890123B'):
+        parser.error("--adaptive ends a -t test early from the sending side, without -R, --bidir or -n.")
+    if args.adaptive is not None and not 0 < args.adaptive < 1:
+        parser.error("--adaptive must be a tolerance between 0 and 1, i.e. 0.02 for 2%.")
+    # The warm-up comes on top of -t, so -t seconds are measured; with -n it is the first seconds of the transfer
+    if args.num == '1234567890123B':
+        args.time += args.omit
+    args.stopFlag = None # Replaced in connect_server when --adaptive may end the test early
+
+    if args.client and args.load and not args.latency:
+        parser.error("--load requires -L.")
+    if args.client and args.latency and args.num != '1234567890123B' and not args.load:
+        parser.error("-L runs for -t seconds, -n is only possible together with --load.")
+    if not UDP_HEADER.size <= args.request_size <= UDP_MAX_LENGTH:
+        parser.error(f"--request-size must be between {UDP_HEADER.size} and {UDP_MAX_LENGTH} bytes.")
+
+    if args.client and args.short_flows and (args.udp or args.latency or args.reverse or args.bidir or args.omit or args.adaptive):
+        parser.error("--short-flows cannot be combined with -u, -L, -R, --bidir, --omit or --adaptive.")
+    if args.client and args.short_flows and (args.workers > 1 or args.engine != 'threaded' or args.zerocopy or args.file):
+        parser.error("--short-flows runs one thread per -P connection in a single process, without -w, -Z, -F or -e asyncio.")
+    if args.client and args.short_flows and args.num != '1234567890123B':
+        parser.error("--short-flows runs for -t seconds, without -n.")
+    if not 1 <= args.response_size <= MAX_LENGTH:
+        parser.error(f"--response-size must be between 1 and {MAX_LENGTH} bytes.")
+
+    if args.file:
+        if not os.access(args.file, os.R_OK):
+            parser.error(f"cannot read file '{args.file}'.")
+        args.zerocopy = True
+
+    # If program is invoked as daemon, the tests it is given choose their own roles
+    if args.daemon is not None:
+        if args.server or args.client:
+            parser.error("-D cannot be combined with -s or -c.")
+        run_daemon(args)
+
     # If program is invoked as server
-    if args.server and not args.client:
+    elif args.server and not args.client:
         try:
             start_server(args)
         except Exception as e:
-            print(f'{args.bind}:{args.port} : {e}')
+            print_error(args, f'{args.bind}:{args.port} : {e}')
             sys.exit()
         
 
@@ -335,7 +2054,7 @@ def main():
         
             # If intervals are printed along the way, print a line to separate the results into two sections
             if args.interval:
-                print('------------------------------------------------------------')
+                print_text(args, '------------------------------------------------------------')
             # If there are no longer any active threads and server sends acknowledgement, result and interval is returned
             for e in outResult:
                 print(e)
@@ -346,7 +2065,7 @@ def main():
         
             # If intervals are printed along the way, print a line to separate the results into two sections
             if args.interval:
-                print('------------------------------------------------------------')
+                print_text(args, '------------------------------------------------------------')
             # If there are no longer any active threads and server sends acknowledgement, result and interval is returned
             for e in outResult:
                 print(e)